@@ -14,9 +14,14 @@ from azure.search.documents.models import (
     VectorizedQuery
 )
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import json
 
+from local_captions import LocalCaptioner
+from suggester import HotelSuggester
+
 # Load environment variables
 load_dotenv()
 
@@ -26,6 +31,17 @@ SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY", "")
 SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME", "hotels-sample-index")
 SEMANTIC_CONFIG_NAME = os.getenv("AZURE_SEARCH_SEMANTIC_CONFIG", "my-semantic-config")
 
+# Fields fetched for result cards
+RESULT_FIELDS = [
+    "HotelId", "HotelName", "Description", "Category", 
+    "Tags", "ParkingIncluded", "LastRenovationDate", 
+    "Rating", "Address"
+]
+
+# Paging: only the visible page is fetched and rendered; recent pages stay cached per session
+PAGE_SIZE_OPTIONS = [5, 10, 20]
+MAX_CACHED_PAGES = 20
+
 def initialize_search_client():
     """Initialize Azure Search client"""
     if not SEARCH_SERVICE_ENDPOINT or not SEARCH_API_KEY:
@@ -44,7 +60,52 @@ def initialize_search_client():
         st.error(f"Failed to initialize search client: {str(e)}")
         st.stop()
 
-def perform_search(search_client, search_text, search_mode="keyword", filters=None, top=10):
+def build_search_params(search_text, search_mode="keyword", filters=None, top=10, skip=0):
+    """
+    Build the search_client.search() arguments for a search mode
+    
+    Args:
+        search_text: Search query text
+        search_mode: Search mode - "keyword", "semantic", or "semantic_filter"
+        filters: OData filter expression
+        top: Number of results to return
+        skip: Number of results to skip (for paging)
+    """
+    # Build base search parameters
+    search_params = {
+        "search_text": search_text if search_text else "*",
+        "select": RESULT_FIELDS,
+        "top": top,
+        "skip": skip,
+        "include_total_count": True
+    }
+    
+    # Configure based on search mode
+    if search_mode == "semantic" or search_mode == "semantic_filter":
+        # Semantic search configuration
+        search_params["query_type"] = QueryType.SEMANTIC
+        search_params["semantic_configuration_name"] = SEMANTIC_CONFIG_NAME
+        search_params["query_caption"] = QueryCaptionType.EXTRACTIVE
+        search_params["query_answer"] = QueryAnswerType.EXTRACTIVE
+        
+        # Add filter for semantic_filter mode
+        if search_mode == "semantic_filter" and filters:
+            search_params["filter"] = filters
+    else:
+        # Keyword search (default)
+        search_params["query_type"] = QueryType.SIMPLE
+        
+        # Don't specify search_fields - let Azure Search use default searchable fields
+        # This avoids errors if specific fields aren't marked as searchable
+        # Azure Search will automatically search all fields marked as "Searchable" in the index
+        
+        # Add filter if provided
+        if filters:
+            search_params["filter"] = filters
+    
+    return search_params
+
+def perform_search(search_client, search_text, search_mode="keyword", filters=None, top=10, skip=0):
     """
     Perform search on Azure Search index with different modes
     
@@ -54,45 +115,11 @@ def perform_search(search_client, search_text, search_mode="keyword", filters=No
         search_mode: Search mode - "keyword", "semantic", or "semantic_filter"
         filters: OData filter expression
         top: Number of results to return
+        skip: Number of results to skip (for paging)
     """
     try:
-        # Build base search parameters
-        search_params = {
-            "search_text": search_text if search_text else "*",
-            "select": [
-                "HotelId", "HotelName", "Description", "Category", 
-                "Tags", "ParkingIncluded", "LastRenovationDate", 
-                "Rating", "Address"
-            ],
-            "top": top,
-            "include_total_count": True
-        }
-        
-        # Configure based on search mode
-        if search_mode == "semantic" or search_mode == "semantic_filter":
-            # Semantic search configuration
-            search_params["query_type"] = QueryType.SEMANTIC
-            search_params["semantic_configuration_name"] = SEMANTIC_CONFIG_NAME
-            search_params["query_caption"] = QueryCaptionType.EXTRACTIVE
-            search_params["query_answer"] = QueryAnswerType.EXTRACTIVE
-            
-            # Add filter for semantic_filter mode
-            if search_mode == "semantic_filter" and filters:
-                search_params["filter"] = filters
-        else:
-            # Keyword search (default)
-            search_params["query_type"] = QueryType.SIMPLE
-            
-            # Don't specify search_fields - let Azure Search use default searchable fields
-            # This avoids errors if specific fields aren't marked as searchable
-            # Azure Search will automatically search all fields marked as "Searchable" in the index
-            
-            # Add filter if provided
-            if filters:
-                search_params["filter"] = filters
-        
         # Execute search
-        results = search_client.search(**search_params)
+        results = search_client.search(**build_search_params(search_text, search_mode, filters, top, skip))
         
         return results
     except Exception as e:
@@ -103,6 +130,121 @@ def perform_search(search_client, search_text, search_mode="keyword", filters=No
             st.info(f"💡 Search parameters used: Query='{search_text}', Mode={search_mode}, Filters={filters}")
         return None
 
+def to_page(results):
+    """
+    Materialize one page of results as plain dicts (cheap to cache in the session)
+    
+    Returns {"hotels": [...], "total_count": int, "answers": [str]}
+    """
+    hotels = []
+    for hotel in results:
+        plain = {field: hotel.get(field) for field in RESULT_FIELDS}
+        plain["score"] = hotel.get("@search.score")
+        plain["reranker_score"] = hotel.get("@search.reranker_score")
+        captions = hotel.get("@search.captions") or []
+        plain["captions"] = [c.text if hasattr(c, "text") else str(c) for c in captions[:1]]
+        hotels.append(plain)
+    answers = results.get_answers() if hasattr(results, "get_answers") else None
+    return {
+        "hotels": hotels,
+        "total_count": results.get_count() or 0,
+        "answers": [a.text if hasattr(a, "text") else str(a) for a in (answers or [])[:1]],
+        "local_answer": False,
+    }
+
+def add_local_captions(page_data, search_text):
+    """Fill in captions and the answer locally where the semantic ranker gave none (any search mode)"""
+    hotels = page_data["hotels"]
+    missing = [hotel for hotel in hotels if not hotel["captions"]]
+    if not missing and page_data["answers"]:
+        return page_data
+    captions, answer = load_captioner().extract(search_text or "", [hotel.get("Description") or "" for hotel in hotels])
+    for hotel, caption in zip(hotels, captions):
+        if not hotel["captions"] and caption is not None:
+            hotel["captions"] = [caption.highlighted]
+    if not page_data["answers"] and answer is not None:
+        page_data["answers"] = [answer.highlighted]
+        page_data["local_answer"] = True
+    return page_data
+
+def fetch_page_quietly(search_client, search_args, page, page_size):
+    """Fetch a page without touching the UI (for background prefetch); None on errors"""
+    search_text, search_mode, filters, max_results = search_args
+    skip = page * page_size
+    try:
+        params = build_search_params(search_text, search_mode, filters, min(page_size, max_results - skip), skip)
+        return add_local_captions(to_page(search_client.search(**params)), search_text)
+    except Exception:
+        return None
+
+@st.cache_resource
+def prefetch_executor():
+    """Small thread pool shared by all sessions for next-page prefetches"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def get_page(search_client, search_args, page, page_size):
+    """
+    Return one page of results, from the session cache, a finished prefetch or a new search
+    
+    search_args is (search_text, search_mode, filters, max_results); only page_size hits are fetched.
+    """
+    cache = st.session_state.page_cache
+    key = (search_args, page_size, page)
+    drop_stale_prefetches(search_args, page_size)
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    
+    future = st.session_state.prefetch.pop(key, None)
+    page_data = future.result() if future is not None else None
+    if page_data is None:
+        search_text, search_mode, filters, max_results = search_args
+        skip = page * page_size
+        results = perform_search(
+            search_client, search_text, search_mode=search_mode, filters=filters,
+            top=min(page_size, max_results - skip), skip=skip
+        )
+        if results is None:
+            return None
+        page_data = add_local_captions(to_page(results), search_text)
+    
+    cache[key] = page_data
+    while len(cache) > MAX_CACHED_PAGES:
+        cache.popitem(last=False)
+    return page_data
+
+def drop_stale_prefetches(search_args, page_size):
+    """Cancel and forget prefetches of earlier searches, so finished ones don't pile up in the session"""
+    prefetch = st.session_state.prefetch
+    for key in [key for key in prefetch if key[:2] != (search_args, page_size)]:
+        prefetch.pop(key).cancel()
+
+def prefetch_page(search_client, search_args, page, page_size):
+    """Start fetching a page in the background unless it is cached or already in flight"""
+    key = (search_args, page_size, page)
+    if key not in st.session_state.page_cache and key not in st.session_state.prefetch:
+        st.session_state.prefetch[key] = prefetch_executor().submit(
+            fetch_page_quietly, search_client, search_args, page, page_size
+        )
+
+def change_page(delta):
+    st.session_state.page = max(0, st.session_state.page + delta)
+
+@st.cache_resource
+def load_suggester():
+    """Build the local typeahead index once per server process"""
+    return HotelSuggester.from_file()
+
+@st.cache_resource
+def load_captioner():
+    """Split and embed the hotel descriptions once per server process"""
+    return LocalCaptioner.from_file()
+
+def use_suggestion(text):
+    """Put a clicked suggestion into the search box (runs before the widgets are redrawn) and search it"""
+    st.session_state.search_query = text
+    st.session_state.suggestion_picked = True
+
 def format_address(address):
     """Format hotel address for display"""
     if not address:
@@ -121,22 +263,22 @@ def format_address(address):
     return ", ".join(parts) if parts else "N/A"
 
 def display_hotel_card(hotel, show_score=False, search_mode="keyword"):
-    """Display hotel information in a card format"""
+    """Display hotel information in a card format (hotel is a plain dict from to_page)"""
     with st.container():
         col1, col2 = st.columns([3, 1])
         
         with col1:
             # Hotel name with search score badge
             hotel_name = hotel.get('HotelName', 'Unknown Hotel')
-            if show_score and hasattr(hotel, '@search.score'):
-                score = getattr(hotel, '@search.score', 0)
+            score = hotel.get('score')
+            if show_score and score is not None:
                 st.markdown(f"### 🏨 {hotel_name} `Score: {score:.2f}`")
             else:
                 st.markdown(f"### 🏨 {hotel_name}")
             
             # Show reranker score for semantic search
-            if search_mode in ["semantic", "semantic_filter"] and hasattr(hotel, '@search.reranker_score'):
-                reranker_score = getattr(hotel, '@search.reranker_score', 0)
+            reranker_score = hotel.get('reranker_score')
+            if search_mode in ["semantic", "semantic_filter"] and reranker_score is not None:
                 st.markdown(f"🎯 **Semantic Relevance Score:** `{reranker_score:.3f}`")
             
             # Category and Tags
@@ -148,14 +290,11 @@ def display_hotel_card(hotel, show_score=False, search_mode="keyword"):
                 tags_str = " • ".join([f"`{tag}`" for tag in tags])
                 st.markdown(f"**Tags:** {tags_str}")
             
-            # Show captions for semantic search
-            if search_mode in ["semantic", "semantic_filter"] and hasattr(hotel, '@search.captions'):
-                captions = getattr(hotel, '@search.captions', [])
-                if captions:
-                    st.markdown("**📝 Relevant Excerpt:**")
-                    for caption in captions[:1]:  # Show first caption
-                        caption_text = caption.text if hasattr(caption, 'text') else str(caption)
-                        st.markdown(f"> {caption_text}")
+            # Show captions (from the semantic ranker, or extracted locally)
+            if hotel.get('captions'):
+                st.markdown("**📝 Relevant Excerpt:**")
+                for caption_text in hotel['captions']:  # Only the first caption is kept
+                    st.markdown(f"> {caption_text}")
             
             # Description
             description = hotel.get('Description', 'No description available')
@@ -196,6 +335,12 @@ def main():
     if 'last_search_params' not in st.session_state:
         st.session_state.last_search_params = None
     
+    # Paging state: current page, cached pages and in-flight prefetches
+    if 'page' not in st.session_state:
+        st.session_state.page = 0
+        st.session_state.page_cache = OrderedDict()
+        st.session_state.prefetch = {}
+    
     # Header
     st.title("🏨 Azure AI Search - Hotels Search Demo")
     st.markdown("""
@@ -242,9 +387,27 @@ def main():
     search_query = st.text_input(
         "Search for hotels",
         placeholder="e.g., romantic getaway near the ocean, business hotel with conference rooms...",
-        help="Enter your search query - semantic search understands natural language!"
+        help="Enter your search query - semantic search understands natural language!",
+        key="search_query"
     )
     
+    # Typeahead: local suggestions (names, tags, cities, categories), no search round-trip
+    suggestions = [
+        s for s in load_suggester().suggest(search_query, n=5)
+        if s.text.lower() != search_query.strip().lower()
+    ] if search_query else []
+    if suggestions:
+        suggestion_cols = st.columns(len(suggestions))
+        for col, suggestion in zip(suggestion_cols, suggestions):
+            col.button(
+                f"🔍 {suggestion.text}",
+                key=f"suggestion_{suggestion.text}",
+                help=f"{suggestion.field} suggestion",
+                on_click=use_suggestion,
+                args=(suggestion.text,),
+                use_container_width=True
+            )
+    
     # Sidebar for filters
     st.sidebar.header("⚙️ Search Configuration")
     
@@ -282,14 +445,19 @@ def main():
         disabled=not filters_enabled
     )
     
-    # Number of results
+    # Number of results (fetched page by page, so a large value costs nothing up front)
     top_results = st.sidebar.slider(
         "Number of results",
         min_value=5,
-        max_value=50,
+        max_value=1000,
         value=10,
         step=5
     )
+    page_size = st.sidebar.select_slider(
+        "Results per page",
+        options=PAGE_SIZE_OPTIONS,
+        value=10
+    )
     
     # Advanced options
     with st.sidebar.expander("🔧 Advanced Options"):
@@ -333,72 +501,101 @@ def main():
     # Create search params tuple for comparison
     params_changed = st.session_state.last_search_params != current_search_params
     
+    # A query still being typed: only the text changed and the typeahead has suggestions for it.
+    # Auto-search waits for a suggestion click or the Search button, so partial or misspelled
+    # queries cost no search request.
+    last_params = st.session_state.last_search_params
+    typing = bool(suggestions) and (last_params is None or last_params[1:] == current_search_params[1:])
+    suggestion_picked = st.session_state.pop("suggestion_picked", False)
+    
     # Determine if we should search:
-    # 1. Button was clicked
-    # 2. Auto-search is on AND parameters changed AND (there's a query or filters)
+    # 1. Button was clicked, or a suggestion was picked
+    # 2. Auto-search is on AND parameters changed AND the query is not still being typed
+    #    AND (there's a query or filters)
     should_search = (
-        search_clicked or 
-        (auto_search and params_changed and (bool(search_query) or bool(filter_string)))
+        search_clicked or suggestion_picked or
+        (auto_search and params_changed and not typing and (bool(search_query) or bool(filter_string)))
     )
+    if typing and params_changed and not should_search:
+        st.caption("💡 Pick a suggestion above or press 🔎 Search to run this query")
     
-    if should_search:
-        # Update last search params
-        st.session_state.last_search_params = current_search_params
-        
-        # Show indicator if auto-search triggered (not button click)
-        if not search_clicked and auto_search:
-            st.info("🔄 Auto-search triggered by filter/mode change")
+    # Keep showing the last search (e.g. while paging) as long as its parameters are unchanged
+    showing_results = should_search or (
+        st.session_state.last_search_params is not None
+        and st.session_state.last_search_params == current_search_params
+    )
+    
+    if showing_results:
+        if should_search:
+            # Update last search params and start from the first page
+            st.session_state.last_search_params = current_search_params
+            st.session_state.page = 0
+            
+            # Show indicator if auto-search triggered (not button click)
+            if not search_clicked and not suggestion_picked and auto_search:
+                st.info("🔄 Auto-search triggered by filter/mode change")
+            
+            # Show debug info if enabled
+            if debug_mode:
+                st.markdown("### 🐛 Debug Information")
+                debug_info = {
+                    "Search Query": search_query or "*",
+                    "Search Mode": search_mode,
+                    "Filter Expression": filter_string or "None",
+                    "Top Results": top_results,
+                    "Page Size": page_size,
+                    "Fields Searched": "All fields marked as 'Searchable' in your Azure Search index (default behavior)"
+                }
+                st.json(debug_info)
         
-        # Show debug info if enabled
-        if debug_mode:
-            st.markdown("### 🐛 Debug Information")
-            debug_info = {
-                "Search Query": search_query or "*",
-                "Search Mode": search_mode,
-                "Filter Expression": filter_string or "None",
-                "Top Results": top_results,
-                "Fields Searched": "All fields marked as 'Searchable' in your Azure Search index (default behavior)"
-            }
-            st.json(debug_info)
+        # Stay within the requested number of results if the page size changed
+        st.session_state.page = min(st.session_state.page, (top_results - 1) // page_size)
+        search_args = (search_query, search_mode, filter_string, top_results)
         
         with st.spinner(f"Searching hotels using {search_mode.replace('_', ' ').title()} mode..."):
-            results = perform_search(
-                search_client,
-                search_query,
-                search_mode=search_mode,
-                filters=filter_string,
-                top=top_results
-            )
+            page_data = get_page(search_client, search_args, st.session_state.page, page_size)
             
-            if results:
+            if page_data:
                 # Get total count
-                total_count = results.get_count()
+                total_count = page_data["total_count"]
                 
                 # Display results count with mode indicator
                 mode_emoji = {"keyword": "🔤", "semantic": "🧠", "semantic_filter": "🎯"}
                 st.success(f"{mode_emoji.get(search_mode, '🔍')} Found **{total_count}** hotels using **{search_mode.replace('_', ' ').title()}** mode")
                 
-                # Show semantic answers if available
-                if search_mode in ["semantic", "semantic_filter"]:
-                    if hasattr(results, 'get_answers') and results.get_answers():
-                        answers = results.get_answers()
-                        if answers:
-                            st.markdown("### 💬 AI-Generated Answer")
-                            for answer in answers[:1]:  # Show first answer
-                                answer_text = answer.text if hasattr(answer, 'text') else str(answer)
-                                st.success(answer_text)
+                # Show the semantic answer, or the best matching sentence on this page
+                if page_data["answers"]:
+                    st.markdown("### 💬 Best Matching Sentence" if page_data["local_answer"] else "### 💬 AI-Generated Answer")
+                    for answer_text in page_data["answers"]:  # Only the first answer is kept
+                        st.success(answer_text)
                 
-                # Convert results to list
-                hotels = list(results)
+                hotels = page_data["hotels"]
                 
                 if hotels:
                     st.markdown("---")
                     st.markdown("### 🏨 Search Results")
                     
-                    # Display each hotel
-                    for idx, hotel in enumerate(hotels, 1):
+                    # Display only the hotels of the current page
+                    first_idx = st.session_state.page * page_size + 1
+                    for idx, hotel in enumerate(hotels, first_idx):
                         st.markdown(f"**Result #{idx}**")
                         display_hotel_card(hotel, show_score=show_scores, search_mode=search_mode)
+                    
+                    # Page navigation
+                    n_pages = max(1, -(-min(total_count, top_results) // page_size))
+                    col_prev, col_page, col_next = st.columns([1, 2, 1])
+                    with col_prev:
+                        st.button("⬅️ Previous", on_click=change_page, args=(-1,),
+                                  disabled=st.session_state.page == 0, use_container_width=True)
+                    with col_page:
+                        st.markdown(f"<div style='text-align: center'>Page {st.session_state.page + 1} of {n_pages}</div>", unsafe_allow_html=True)
+                    with col_next:
+                        st.button("Next ➡️", on_click=change_page, args=(1,),
+                                  disabled=st.session_state.page + 1 >= n_pages, use_container_width=True)
+                    
+                    # Fetch the next page in the background while this one is being read
+                    if st.session_state.page + 1 < n_pages:
+                        prefetch_page(search_client, search_args, st.session_state.page + 1, page_size)
                 else:
                     st.warning("❌ No hotels found matching your search criteria.")
                     st.markdown("### 💡 Troubleshooting Tips:")
@@ -497,6 +694,7 @@ def main():
     - BM25 ranking algorithm
     - Term frequency analysis
     - Traditional full-text search
+    - Captions & best sentence extracted locally
     
     **🧠 Semantic Search:**
     - AI-powered query understanding
@@ -0,0 +1,223 @@
+"""
+Bulk indexer for the hotels sample data
+Loads (or reloads) HotelsData_toAzureBlobs.json into the search index without the portal
+
+- Streams the JSON array one document at a time (memory stays flat for large catalogs)
+- Sends merge_or_upload batches bounded by document count AND payload bytes
+- Uploads several batches in parallel
+- Retries per-document failures (409/422/429/5xx) with exponential backoff
+- Documents with IsDeleted = true are removed from the index instead
+- Reports throughput in docs/sec
+
+Works against the local stand-in too:
+    python ../lab-1/standin_server.py --port 8010 &
+    AZURE_SEARCH_ENDPOINT=http://localhost:8010 AZURE_SEARCH_API_KEY=x python bulk_index_hotels.py
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+from azure.search.documents import IndexDocumentsBatch, SearchClient
+
+# Load environment variables
+load_dotenv()
+
+SEARCH_SERVICE_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT", "")
+SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY", "")
+SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME", "hotels-sample-index")
+
+KEY_FIELD = "HotelId"
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "HotelsData_toAzureBlobs.json")
+
+# Service limits: 1000 actions and 16 MB per indexing request
+MAX_BATCH_DOCS = 1000
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+RETRYABLE_STATUS = {409, 422, 429, 500, 502, 503, 504}
+
+
+def iter_json_array(path: str, buffer_size: int = 1 << 16) -> Iterator[dict]:
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if not started and pos < len(buffer):
+                    if buffer[pos] != "[":
+                        raise ValueError(f"{path} does not contain a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                break
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                doc, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    if buffer[pos:].strip():
+                        raise
+                    return
+                chunk = f.read(buffer_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield doc
+            pos = end
+
+
+def iter_batches(docs: Iterator[dict], max_docs: int, max_bytes: int) -> Iterator[List[Tuple[dict, int]]]:
+    """Group documents into batches bounded by count and serialized size"""
+    batch, batch_bytes = [], 0
+    for doc in docs:
+        size = len(json.dumps(doc, ensure_ascii=False).encode("utf-8"))
+        if batch and (len(batch) >= max_docs or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append((doc, size))
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+class Stats:
+    """Thread-safe counters for the indexing run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploaded = 0
+        self.deleted = 0
+        self.failed = 0
+        self.retries = 0
+        self.start = time.perf_counter()
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        done = self.uploaded + self.deleted
+        return (
+            f"{self.uploaded} uploaded, {self.deleted} deleted, {self.failed} failed, "
+            f"{self.retries} retries in {elapsed:.2f}s ({done / elapsed if elapsed else 0:.1f} docs/sec)"
+        )
+
+
+def index_batch(search_client, docs: List[dict], stats: Stats, max_retries: int = 5, base_delay: float = 0.5):
+    """Index one batch, retrying only the documents that failed"""
+    pending = {str(doc[KEY_FIELD]): doc for doc in docs}
+    for attempt in range(max_retries + 1):
+        batch = IndexDocumentsBatch()
+        upserts = [d for d in pending.values() if not d.get("IsDeleted")]
+        deletes = [{KEY_FIELD: d[KEY_FIELD]} for d in pending.values() if d.get("IsDeleted")]
+        if upserts:
+            batch.add_merge_or_upload_actions(upserts)
+        if deletes:
+            batch.add_delete_actions(deletes)
+
+        try:
+            results = search_client.index_documents(batch)
+        except (HttpResponseError, ServiceRequestError) as e:
+            status = getattr(e, "status_code", None)
+            if status is not None and status not in RETRYABLE_STATUS:
+                raise
+            results = None  # the whole request failed; retry everything
+
+        if results is not None:
+            for result in results:
+                if result.succeeded:
+                    doc = pending.pop(str(result.key), None)
+                    if doc is not None:
+                        stats.add(**{"deleted" if doc.get("IsDeleted") else "uploaded": 1})
+                elif result.status_code not in RETRYABLE_STATUS:
+                    pending.pop(str(result.key), None)
+                    stats.add(failed=1)
+                    print(f"❌ {KEY_FIELD}={result.key}: {result.status_code} {result.error_message}")
+
+        if not pending:
+            return
+        if attempt < max_retries:
+            stats.add(retries=len(pending))
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, base_delay * (2 ** attempt)))
+
+    stats.add(failed=len(pending))
+    print(f"❌ Giving up on {len(pending)} documents after {max_retries} retries: {', '.join(pending)}")
+
+
+def bulk_index(
+    search_client,
+    data_file: str,
+    max_docs: int = MAX_BATCH_DOCS,
+    max_bytes: int = MAX_BATCH_BYTES,
+    parallelism: int = 4,
+    max_retries: int = 5,
+) -> Stats:
+    """Stream data_file into the index with up to `parallelism` batches in flight"""
+    stats = Stats()
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        in_flight = set()
+        for batch in iter_batches(iter_json_array(data_file), max_docs, max_bytes):
+            # Keep at most 2x parallelism batches queued so memory stays bounded
+            if len(in_flight) >= parallelism * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            docs = [doc for doc, _ in batch]
+            in_flight.add(pool.submit(index_batch, search_client, docs, stats, max_retries))
+        for future in in_flight:
+            future.result()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load hotel documents into the search index")
+    parser.add_argument("data_file", nargs="?", default=DEFAULT_DATA_FILE, help="JSON array of hotel documents")
+    parser.add_argument("--batch-docs", type=int, default=MAX_BATCH_DOCS, help="Maximum documents per request")
+    parser.add_argument("--batch-bytes", type=int, default=MAX_BATCH_BYTES, help="Maximum payload bytes per request")
+    parser.add_argument("--parallel", type=int, default=4, help="Batches uploaded in parallel")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries for failed documents")
+    args = parser.parse_args()
+
+    if not SEARCH_SERVICE_ENDPOINT or not SEARCH_API_KEY:
+        print("⚠️ Please configure AZURE_SEARCH_ENDPOINT and AZURE_SEARCH_API_KEY in .env file")
+        return
+
+    search_client = SearchClient(
+        endpoint=SEARCH_SERVICE_ENDPOINT,
+        index_name=SEARCH_INDEX_NAME,
+        credential=AzureKeyCredential(SEARCH_API_KEY)
+    )
+    print(f"📤 Indexing {args.data_file} into '{SEARCH_INDEX_NAME}' at {SEARCH_SERVICE_ENDPOINT}")
+    stats = bulk_index(
+        search_client,
+        args.data_file,
+        max_docs=args.batch_docs,
+        max_bytes=args.batch_bytes,
+        parallelism=args.parallel,
+        max_retries=args.max_retries,
+    )
+    print(f"✅ {stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
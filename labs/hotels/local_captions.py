@@ -0,0 +1,190 @@
+"""
+Local extractive captions and answers for hotel search results
+Works in every search mode, with no semantic ranker call
+
+- Hotel descriptions are split into sentences ahead of time, and each sentence gets a
+  hashed bag-of-words embedding (TF-IDF weighted, L2-normalized) that is cached per description
+- At query time the sentences of all hotels on the page are scored against the query
+  in one matrix-vector product
+- Each hotel's best sentence becomes its caption, with query terms in **bold**
+- The best sentence overall becomes the answer if its score clears ANSWER_THRESHOLD
+
+    python local_captions.py "hotel near times square"
+"""
+
+import argparse
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from bulk_index_hotels import DEFAULT_DATA_FILE, iter_json_array
+from suggester import normalize
+
+DIMENSIONS = 1 << 12
+ANSWER_THRESHOLD = 0.35
+MAX_CACHED_DESCRIPTIONS = 10_000
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+WORD = re.compile(r"[A-Za-z0-9']+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our the this to with you your "
+    "we i me my what where which who how can do does there".split()
+)
+
+
+class Caption(NamedTuple):
+    text: str
+    highlighted: str
+    score: float
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a description into sentences on ., ! or ? followed by a capitalized word"""
+    return [s.strip() for s in SENTENCE_END.split(text or "") if s.strip()]
+
+
+@lru_cache(maxsize=1 << 16)
+def term(word: str) -> str:
+    """Normalized word with a light plural/suffix strip, so 'rooms' matches 'room'"""
+    word = normalize(word).strip("'")
+    for suffix in ("ies", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix) and not word.endswith("ss"):
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def terms(text: str) -> List[str]:
+    return [t for t in (term(w) for w in WORD.findall(text)) if t and t not in STOPWORDS]
+
+
+def bucket(t: str) -> int:
+    return zlib.crc32(t.encode("utf-8")) % DIMENSIONS
+
+
+def highlight(sentence: str, query_terms: set) -> str:
+    """Wrap the words of sentence that match a query term in ** for Markdown"""
+    return WORD.sub(lambda m: f"**{m.group(0)}**" if term(m.group(0)) in query_terms else m.group(0), sentence)
+
+
+class LocalCaptioner:
+    """Per-description sentence embeddings with vectorized caption and answer extraction"""
+
+    def __init__(self, descriptions: Iterable[str] = ()):
+        self._entries: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        descriptions = [d for d in descriptions if d]
+
+        # Document frequency per bucket over all known sentences; unseen buckets get the max IDF
+        df = np.zeros(DIMENSIONS, dtype=np.float32)
+        n_sentences = 0
+        for description in dict.fromkeys(descriptions):
+            for sentence in split_sentences(description):
+                n_sentences += 1
+                df[list({bucket(t) for t in terms(sentence)})] += 1
+        self.idf = np.log((n_sentences + 1) / (df + 1)).astype(np.float32) + 1
+
+        for description in descriptions:
+            self.entry(description)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[dict]) -> "LocalCaptioner":
+        return cls(doc.get("Description") for doc in docs if not doc.get("IsDeleted"))
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_DATA_FILE) -> "LocalCaptioner":
+        return cls.from_documents(iter_json_array(path))
+
+    def embed(self, text: str) -> np.ndarray:
+        """Hashed TF-IDF vector of text, L2-normalized"""
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        for t in terms(text):
+            vector[bucket(t)] += 1
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def entry(self, description: str) -> Tuple[List[str], np.ndarray]:
+        """Sentences of description and their embeddings, computed once and cached"""
+        cached = self._entries.get(description)
+        if cached is not None:
+            return cached
+        sentences = split_sentences(description)
+        vectors = np.stack([self.embed(s) for s in sentences]) if sentences else np.zeros((0, DIMENSIONS), np.float32)
+        with self._lock:
+            if len(self._entries) >= MAX_CACHED_DESCRIPTIONS:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[description] = (sentences, vectors)
+        return sentences, vectors
+
+    def extract(self, query: str, descriptions: List[str]) -> Tuple[List[Optional[Caption]], Optional[Caption]]:
+        """
+        Best sentence per description, and the best sentence overall as the answer
+
+        Returns (captions, answer); a caption is None when no sentence shares a term with the query
+        """
+        query_terms = set(terms(query))
+        if not query_terms:
+            return [None] * len(descriptions), None
+        entries = [self.entry(d or "") for d in descriptions]
+        counts = np.array([len(sentences) for sentences, _ in entries])
+        if counts.sum() == 0:
+            return [None] * len(descriptions), None
+
+        # One pass over the query's buckets for every candidate sentence
+        q = self.embed(query)
+        nonzero = np.flatnonzero(q)
+        matrix = np.concatenate([vectors[:, nonzero] for _, vectors in entries])
+        scores = matrix @ q[nonzero]
+
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        captions = []
+        for (sentences, _), start, count in zip(entries, starts, counts):
+            if count == 0:
+                captions.append(None)
+                continue
+            best = int(np.argmax(scores[start : start + count]))
+            score = float(scores[start + best])
+            captions.append(Caption(sentences[best], highlight(sentences[best], query_terms), score) if score > 0 else None)
+
+        found = [c for c in captions if c is not None]
+        answer = max(found, key=lambda c: c.score) if found else None
+        return captions, answer if answer is not None and answer.score >= ANSWER_THRESHOLD else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Try local captions and answers over the hotel descriptions")
+    parser.add_argument("query", help="Search text, e.g. 'hotel near times square'")
+    parser.add_argument("--data-file", default=DEFAULT_DATA_FILE)
+    parser.add_argument("-n", type=int, default=5, help="Captions to print")
+    args = parser.parse_args()
+
+    docs = [doc for doc in iter_json_array(args.data_file) if not doc.get("IsDeleted")]
+    start = time.perf_counter()
+    captioner = LocalCaptioner.from_documents(docs)
+    print(f"📚 Embedded {sum(len(s) for s, _ in captioner._entries.values())} sentences "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    descriptions = [doc.get("Description") for doc in docs]
+    start = time.perf_counter()
+    runs = 100
+    for _ in range(runs):
+        captions, answer = captioner.extract(args.query, descriptions)
+    elapsed_us = (time.perf_counter() - start) / runs * 1e6
+
+    if answer:
+        print(f"💬 {answer.highlighted} ({answer.score:.2f})")
+    ranked = sorted(
+        ((c, doc) for c, doc in zip(captions, docs) if c is not None), key=lambda item: -item[0].score
+    )[: args.n]
+    for caption, doc in ranked:
+        print(f"🏨 {doc.get('HotelName')}: {caption.highlighted} ({caption.score:.2f})")
+    print(f"⏱️ {elapsed_us:.1f} µs per query over {len(descriptions)} hotels")
+
+
+if __name__ == "__main__":
+    main()
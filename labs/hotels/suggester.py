@@ -0,0 +1,168 @@
+"""
+Local typeahead suggester for the hotels search box
+Built from HotelsData_toAzureBlobs.json (HotelName, Tags, City, Category), no search round-trip per keystroke
+
+- Every phrase is indexed under each of its word suffixes ("city hotel", "hotel", ...)
+  in one sorted array, so a prefix lookup is a binary search plus a slice
+- Suggestions are ranked by popularity: how many hotels use the phrase, weighted by field
+- With fewer than n exact completions, the last word is also corrected within one edit
+  (insert, delete, substitute or swap) using a deletion-neighborhood index over word prefixes
+
+    python suggester.py "lux"
+    python suggester.py "seatle"    # -> Seattle
+"""
+
+import argparse
+import bisect
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Set
+
+from bulk_index_hotels import DEFAULT_DATA_FILE, iter_json_array
+
+# Field weights for popularity: a hotel name is a strong query, a category a broad one
+FIELD_WEIGHTS = {"HotelName": 3.0, "City": 2.0, "Tags": 1.0, "Category": 1.0}
+FUZZY_PENALTY = 0.5
+MIN_FUZZY_LENGTH = 3
+
+
+class Suggestion(NamedTuple):
+    text: str
+    field: str
+    weight: float
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def _deletes(word: str) -> Set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insert, delete, substitution or adjacent swap"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+class HotelSuggester:
+    """Sorted-array prefix index over hotel phrases with popularity weights and fuzzy fallback"""
+
+    def __init__(self, phrases: Dict[str, tuple]):
+        """phrases maps normalized phrase -> (display text, field, weight)"""
+        self.phrases = [phrases[key] for key in sorted(phrases)]
+        entries = []
+        for phrase_id, key in enumerate(sorted(phrases)):
+            words = key.split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), phrase_id))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = [phrase_id for _, phrase_id in entries]
+
+        # Deletion neighborhood of every word prefix, for one-edit prefix correction
+        self.prefix_deletes: Dict[str, Set[str]] = defaultdict(set)
+        vocabulary = {word for key in phrases for word in key.split()}
+        for word in vocabulary:
+            for end in range(1, len(word) + 1):
+                prefix = word[:end]
+                for variant in _deletes(prefix) | {prefix}:
+                    self.prefix_deletes[variant].add(prefix)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[dict]) -> "HotelSuggester":
+        counts: Dict[str, float] = defaultdict(float)
+        display: Dict[str, tuple] = {}
+        for doc in docs:
+            if doc.get("IsDeleted"):
+                continue
+            values = [("HotelName", doc.get("HotelName")), ("Category", doc.get("Category"))]
+            values.append(("City", (doc.get("Address") or {}).get("City")))
+            values += [("Tags", tag) for tag in doc.get("Tags") or []]
+            for field, value in values:
+                if not value:
+                    continue
+                key = normalize(value)
+                counts[key] += FIELD_WEIGHTS[field]
+                # Keep the field with the highest weight for display
+                if key not in display or FIELD_WEIGHTS[field] > FIELD_WEIGHTS[display[key][1]]:
+                    display[key] = (value, field)
+        return cls({key: (text, field, counts[key]) for key, (text, field) in display.items()})
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_DATA_FILE) -> "HotelSuggester":
+        return cls.from_documents(iter_json_array(path))
+
+    def _prefix_ids(self, prefix: str) -> List[int]:
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+        return self.ids[start:end]
+
+    def _corrections(self, word: str) -> Set[str]:
+        """Word prefixes within one edit of word"""
+        found = set()
+        for variant in _deletes(word) | {word}:
+            for prefix in self.prefix_deletes.get(variant, ()):
+                if prefix != word and within_one_edit(word, prefix):
+                    found.add(prefix)
+        return found
+
+    def suggest(self, text: str, n: int = 8) -> List[Suggestion]:
+        """Top n phrases that complete text, best first"""
+        query = normalize(text)
+        if not query:
+            return []
+        exact = set(self._prefix_ids(query))
+        scores = {phrase_id: self.phrases[phrase_id][2] for phrase_id in exact}
+
+        words = query.split(" ")
+        if len(scores) < n and len(words[-1]) >= MIN_FUZZY_LENGTH:
+            head = " ".join(words[:-1] + [""])
+            for prefix in self._corrections(words[-1]):
+                for phrase_id in self._prefix_ids(head + prefix):
+                    weight = self.phrases[phrase_id][2] * FUZZY_PENALTY
+                    if phrase_id not in exact and weight > scores.get(phrase_id, 0.0):
+                        scores[phrase_id] = weight
+
+        # Exact completions first, then corrections; popularity, then shorter text within each
+        best = sorted(
+            scores.items(), key=lambda item: (item[0] not in exact, -item[1], len(self.phrases[item[0]][0]))
+        )[:n]
+        return [Suggestion(self.phrases[i][0], self.phrases[i][1], weight) for i, weight in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Try the hotel typeahead suggester")
+    parser.add_argument("query", help="Partial query, e.g. 'lux' or 'seatle'")
+    parser.add_argument("--data-file", default=DEFAULT_DATA_FILE)
+    parser.add_argument("-n", type=int, default=8)
+    args = parser.parse_args()
+
+    suggester = HotelSuggester.from_file(args.data_file)
+    start = time.perf_counter()
+    runs = 1000
+    for _ in range(runs):
+        suggestions = suggester.suggest(args.query, args.n)
+    elapsed_us = (time.perf_counter() - start) / runs * 1e6
+    for suggestion in suggestions:
+        print(f"{suggestion.text:40} {suggestion.field:10} {suggestion.weight:.1f}")
+    print(f"⏱️ {elapsed_us:.1f} µs per lookup over {len(suggester.phrases)} phrases")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import os
 import json
 import requests
 import time
-from openai import AzureOpenAI
+from openai_clients import get_client
 
 #read .env variables
 from dotenv import load_dotenv
@@ -12,11 +12,8 @@ load_dotenv()
 print("AZURE_OPENAI_ENDPOINT:", os.getenv("AZURE_OPENAI_ENDPOINT"))
 
 
-client = AzureOpenAI(
-  azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT"),
-  api_key= os.getenv("AZURE_OPENAI_API_KEY"),
-  api_version="2024-05-01-preview"
-)
+# The Assistants API is only available in preview API versions
+client = get_client(api_version="2024-05-01-preview")
 
 # Read vector store ID and model name from .env
 vector_store_id = os.getenv("VECTOR_STORE_ID")
@@ -1,5 +1,5 @@
 import os
-from openai import AzureOpenAI
+from openai_clients import get_client
 
 #read .env variables
 from dotenv import load_dotenv
@@ -9,11 +9,7 @@ load_dotenv()
 # print("AZURE_OPENAI_API_KEY:", os.getenv("AZURE_OPENAI_API_KEY"))
 print("AZURE_OPENAI_ENDPOINT:", os.getenv("AZURE_OPENAI_ENDPOINT"))
 
-client = AzureOpenAI(
-  azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT"), 
-  api_key=os.getenv("AZURE_OPENAI_API_KEY"),  
-  api_version="2024-02-01"
-)
+client = get_client()
 
 response = client.chat.completions.create(
     model="gpt-4o-mini", 
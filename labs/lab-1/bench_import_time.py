@@ -0,0 +1,66 @@
+"""
+Import-time benchmark for embeddings_utils.
+
+Imports the module in fresh interpreters, reports the median wall time, and
+fails (exit code 1) if the import is slower than the budget or if any heavy
+optional dependency was loaded eagerly.
+
+Usage:
+    python bench_import_time.py --runs 10 --budget-ms 250
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["matplotlib", "plotly", "scipy", "sklearn", "pandas", "openai"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import embeddings_utils
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(runs: int):
+    """Return (median import seconds, heavy modules loaded) over ``runs`` fresh interpreters."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings, heavy = [], set()
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE], cwd=here, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        heavy.update(result["heavy"])
+    return statistics.median(timings), sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Maximum median import time")
+    args = parser.parse_args(argv)
+
+    median, heavy = measure(args.runs)
+    print(f"import embeddings_utils: median {median * 1000:.1f} ms over {args.runs} runs")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if median * 1000 > args.budget_ms:
+        print(f"FAIL: median import time exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Micro-batching of concurrent query embeddings.
+
+Each search request needs its query text embedded first; under concurrent
+load one ``get_embedding`` call per request means many tiny HTTP calls and
+quickly hits rate limits. ``EmbeddingBatcher`` collects the texts submitted
+by concurrent callers for at most ``max_wait_ms`` (or until ``max_batch``
+texts are waiting), sends them as one ``get_embeddings`` call and hands each
+caller its own vector. Identical texts in a window are embedded once.
+
+Usage:
+    batcher = EmbeddingBatcher(max_wait_ms=10)
+    vector = batcher.embed("delicious beans")          # from any thread
+    vector = await batcher.aembed("delicious beans")   # from asyncio code
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import embeddings_utils
+
+MAX_BATCH = 2048  # inputs per embeddings request
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding requests into batched calls."""
+
+    def __init__(
+        self,
+        embed_many: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        model: str = embeddings_utils.DEFAULT_MODEL,
+        max_batch: int = 64,
+        max_wait_ms: float = 10.0,
+    ):
+        if not 1 <= max_batch <= MAX_BATCH:
+            raise ValueError(f"max_batch must be between 1 and {MAX_BATCH}")
+        self.embed_many = embed_many or (lambda texts: embeddings_utils.get_embeddings(texts, model=model))
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = Counter()
+        # Each dispatcher thread drains its own queue, so a submit racing close() lands
+        # either before the stop marker or in the queue of a fresh dispatcher.
+        self._pending: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def submit(self, text: str) -> Future:
+        """Queue ``text`` for the next batch; the future yields its embedding."""
+        future = Future()
+        with self._lock:
+            if self._dispatcher is None:
+                self._pending = queue.Queue()
+                self._dispatcher = threading.Thread(target=self._dispatch, args=(self._pending,), daemon=True)
+                self._dispatcher.start()
+            self._pending.put((text.replace("\n", " "), future))
+        return future
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self.submit(text).result(timeout)
+
+    async def aembed(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self):
+        """Embed what is already queued, then stop the dispatcher thread."""
+        with self._lock:
+            dispatcher, self._dispatcher = self._dispatcher, None
+            if dispatcher is not None:
+                self._pending.put(None)
+        if dispatcher is not None:
+            dispatcher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_batch(self, pending: queue.Queue):
+        item = pending.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = pending.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                pending.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self, pending: queue.Queue):
+        while True:
+            batch = self._next_batch(pending)
+            if batch is None:
+                return
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.embed_many(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats["calls"] += 1
+            self.stats["texts"] += len(batch)
+            for text, future in batch:
+                future.set_result(vectors[text])
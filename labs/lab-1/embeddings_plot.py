@@ -0,0 +1,256 @@
+"""Dimensionality reduction and charting helpers for embeddings.
+
+Loaded lazily by ``embeddings_utils`` so that importing the core does not pull
+in scikit-learn, plotly or pandas.
+
+Large sets (100k+ points) should go through ``project_embeddings``: it
+accepts a memory-mapped array (e.g. a vector store segment), fits PCA
+incrementally in row chunks, reduces to ``pca_dims`` with PCA before t-SNE
+and runs t-SNE on a subsample only, and can cache the projection on disk.
+The charts render with WebGL and thin dense regions with
+``downsample_by_density`` so the browser only receives ``max_points`` markers.
+"""
+
+import hashlib
+import os
+import textwrap as tr
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.manifold import TSNE
+
+# Above this many rows, PCA is fitted incrementally in chunks of CHUNK_ROWS.
+INCREMENTAL_PCA_ROWS = 50_000
+CHUNK_ROWS = 10_000
+# Points sent to the browser by the charts; denser regions are thinned first.
+MAX_CHART_POINTS = 50_000
+
+
+def _as_array(embeddings) -> np.ndarray:
+    """Use arrays (including memory maps) as they are; convert lists to float32."""
+    if isinstance(embeddings, np.ndarray):
+        return embeddings
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def pca_components_from_embeddings(
+    embeddings: List[List[float]], n_components=2
+) -> np.ndarray:
+    """Return the PCA components of a list of embeddings.
+
+    Large arrays are fitted and transformed in row chunks with
+    ``IncrementalPCA``, so a memory-mapped array is never loaded at once.
+    """
+    array_of_embeddings = _as_array(embeddings)
+    if len(array_of_embeddings) <= INCREMENTAL_PCA_ROWS:
+        pca = PCA(n_components=n_components)
+        return pca.fit_transform(np.asarray(array_of_embeddings))
+
+    pca = IncrementalPCA(n_components=n_components)
+    starts = range(0, len(array_of_embeddings), CHUNK_ROWS)
+    for start in starts:
+        chunk = np.asarray(array_of_embeddings[start : start + CHUNK_ROWS], dtype=np.float32)
+        if len(chunk) >= n_components:  # partial_fit needs at least n_components rows
+            pca.partial_fit(chunk)
+    return np.concatenate(
+        [pca.transform(np.asarray(array_of_embeddings[start : start + CHUNK_ROWS], dtype=np.float32)) for start in starts]
+    )
+
+
+def tsne_components_from_embeddings(
+    embeddings: List[List[float]], n_components=2, pca_dims: Optional[int] = 50, **kwargs
+) -> np.ndarray:
+    """Returns t-SNE components of a list of embeddings.
+
+    Inputs wider than ``pca_dims`` are first reduced with PCA, which speeds up
+    t-SNE's neighbor search without changing the picture much. Pass
+    ``pca_dims=None`` to run t-SNE on the raw embeddings.
+    """
+    # use better defaults if not specified
+    if "init" not in kwargs.keys():
+        kwargs["init"] = "pca"
+    if "learning_rate" not in kwargs.keys():
+        kwargs["learning_rate"] = "auto"
+    array_of_embeddings = _as_array(embeddings)
+    if pca_dims and array_of_embeddings.shape[1] > pca_dims and len(array_of_embeddings) > pca_dims:
+        array_of_embeddings = pca_components_from_embeddings(array_of_embeddings, n_components=pca_dims)
+    tsne = TSNE(n_components=n_components, **kwargs)
+    return tsne.fit_transform(np.asarray(array_of_embeddings))
+
+
+def _fingerprint(array: np.ndarray, *params) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((array.shape, str(array.dtype), params)).encode())
+    for start in range(0, len(array), CHUNK_ROWS):
+        digest.update(np.ascontiguousarray(array[start : start + CHUNK_ROWS]).tobytes())
+    return digest.hexdigest()
+
+
+def project_embeddings(
+    embeddings,
+    method: str = "pca",
+    n_components: int = 2,
+    max_points: Optional[int] = None,
+    pca_dims: int = 50,
+    cache_dir: Optional[str] = None,
+    seed: int = 0,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Project (a sample of) ``embeddings`` to ``n_components`` dimensions.
+
+    ``method`` is ``"pca"`` or ``"tsne"``. With ``max_points``, a uniform
+    random sample of that many rows is projected (t-SNE is quadratic-ish and
+    should not see 100k points). Returns ``(row indices, components)``.
+
+    With ``cache_dir``, results are stored as ``.npz`` files keyed by a hash
+    of the data and the parameters, and reused on the next call.
+    """
+    if method not in ("pca", "tsne"):
+        raise ValueError(f"unknown method {method!r}, expected 'pca' or 'tsne'")
+    array_of_embeddings = _as_array(embeddings)
+
+    cache_path = None
+    if cache_dir:
+        key = _fingerprint(array_of_embeddings, method, n_components, max_points, pca_dims, seed, sorted(kwargs.items()))
+        cache_path = os.path.join(cache_dir, f"{method}-{key}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached["indices"], cached["components"]
+
+    indices = np.arange(len(array_of_embeddings))
+    if max_points and len(indices) > max_points:
+        indices = np.sort(np.random.default_rng(seed).choice(len(indices), max_points, replace=False))
+        # Sorted fancy indexing reads a memory map sequentially.
+        array_of_embeddings = array_of_embeddings[indices]
+
+    if method == "pca":
+        components = pca_components_from_embeddings(array_of_embeddings, n_components)
+    else:
+        kwargs.setdefault("random_state", seed)
+        components = tsne_components_from_embeddings(array_of_embeddings, n_components, pca_dims=pca_dims, **kwargs)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache_path + ".tmp.npz"
+        np.savez(tmp, indices=indices, components=components)
+        os.replace(tmp, cache_path)
+    return indices, components
+
+
+def downsample_by_density(components: np.ndarray, max_points: int, bins: int = 200, seed: int = 0) -> np.ndarray:
+    """Return sorted indices of at most ``max_points`` rows, thinning dense areas first.
+
+    Points are binned on a grid over their first (up to three) components
+    (coarsened if there are more occupied cells than ``max_points``). Every
+    cell keeps at most ``cap`` random points, with ``cap`` the largest
+    value that fits the budget, so sparse cells and outliers survive intact
+    while dense clusters are sampled down.
+    """
+    n = len(components)
+    if n <= max_points:
+        return np.arange(n)
+    coords = np.asarray(components[:, :3], dtype=np.float64)
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    scaled = (coords - lo) / np.maximum(hi - lo, 1e-12)
+    while True:
+        cells = np.minimum((scaled * bins).astype(np.int64), bins - 1)
+        cell = np.ravel_multi_index(cells.T, (bins,) * cells.shape[1])
+        _, cell_index, counts = np.unique(cell, return_inverse=True, return_counts=True)
+        # Coarsen the grid until one point per occupied cell fits the budget.
+        if len(counts) <= max_points or bins == 1:
+            break
+        bins = max(1, bins // 2)
+
+    # Largest cap with sum(min(count, cap)) <= max_points.
+    lo_cap, hi_cap = 0, int(counts.max())
+    while lo_cap < hi_cap:
+        mid = (lo_cap + hi_cap + 1) // 2
+        if np.minimum(counts, mid).sum() <= max_points:
+            lo_cap = mid
+        else:
+            hi_cap = mid - 1
+    cap = max(lo_cap, 1)
+
+    # Rank the points of each cell in random order and keep the first cap.
+    order = np.lexsort((np.random.default_rng(seed).random(n), cell_index))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, counts)
+    return np.flatnonzero(rank < cap)
+
+
+def _chart_data(components, labels, strings, titles, max_points, seed):
+    """Downsample and tabulate components, labels and hover strings for plotting."""
+    keep = None
+    if max_points and len(components) > max_points:
+        keep = downsample_by_density(components, max_points, seed=seed)
+        components = components[keep]
+        labels = np.asarray(labels)[keep].tolist() if labels else labels
+        strings = np.asarray(strings, dtype=object)[keep].tolist() if strings else strings
+    empty_list = ["" for _ in components]
+    columns = {title: components[:, i] for i, title in enumerate(titles)}
+    columns["label"] = labels if labels else empty_list
+    columns["string"] = (
+        ["<br>".join(tr.wrap(string, width=30)) for string in strings] if strings else empty_list
+    )
+    return pd.DataFrame(columns)
+
+
+def chart_from_components(
+    components: np.ndarray,
+    labels: Optional[List[str]] = None,
+    strings: Optional[List[str]] = None,
+    x_title="Component 0",
+    y_title="Component 1",
+    mark_size=5,
+    max_points: Optional[int] = MAX_CHART_POINTS,
+    seed: int = 0,
+    **kwargs,
+):
+    """Return an interactive 2D chart of embedding components.
+
+    Rendered with WebGL; above ``max_points`` points, dense regions are
+    downsampled first (``max_points=None`` plots everything).
+    """
+    data = _chart_data(components, labels, strings, (x_title, y_title), max_points, seed)
+    kwargs.setdefault("render_mode", "webgl")
+    chart = px.scatter(
+        data,
+        x=x_title,
+        y=y_title,
+        color="label" if labels else None,
+        symbol="label" if labels else None,
+        hover_data=["string"] if strings else None,
+        **kwargs,
+    ).update_traces(marker=dict(size=mark_size))
+    return chart
+
+
+def chart_from_components_3D(
+    components: np.ndarray,
+    labels: Optional[List[str]] = None,
+    strings: Optional[List[str]] = None,
+    x_title: str = "Component 0",
+    y_title: str = "Component 1",
+    z_title: str = "Compontent 2",
+    mark_size: int = 5,
+    max_points: Optional[int] = MAX_CHART_POINTS,
+    seed: int = 0,
+    **kwargs,
+):
+    """Return an interactive 3D chart of embedding components (WebGL, density-downsampled)."""
+    data = _chart_data(components, labels, strings, (x_title, y_title, z_title), max_points, seed)
+    chart = px.scatter_3d(
+        data,
+        x=x_title,
+        y=y_title,
+        z=z_title,
+        color="label" if labels else None,
+        symbol="label" if labels else None,
+        hover_data=["string"] if strings else None,
+        **kwargs,
+    ).update_traces(marker=dict(size=mark_size))
+    return chart
@@ -0,0 +1,228 @@
+"""
+Process-wide OpenAI / Azure OpenAI clients.
+
+Every script used to build its own ``AzureOpenAI``/``OpenAI`` client with a
+hard-coded ``api_version``, so nothing shared HTTP connections or retry
+settings. ``get_client()`` and ``get_async_client()`` instead hand out one
+cached client per (endpoint, api_version, key), all backed by a single
+keep-alive connection pool, with one retry/timeout policy and a cap on
+in-flight requests per endpoint host. Async connections and semaphores
+belong to an event loop, so async clients are cached per running loop.
+
+Settings come from the environment (or .env):
+
+    AZURE_OPENAI_ENDPOINT / AZURE_ENDPOINT    use Azure OpenAI when set
+    AZURE_OPENAI_API_KEY / AZURE_API_KEY
+    AZURE_OPENAI_API_VERSION                  default 2024-06-01
+    OPENAI_MAX_RETRIES                        default 5
+    OPENAI_TIMEOUT                            seconds, default 60
+    OPENAI_MAX_CONNECTIONS                    pool size, default 64
+    OPENAI_MAX_CONCURRENCY                    in-flight requests per host, default 16
+
+Usage:
+    from openai_clients import get_client
+    client = get_client()
+    client.chat.completions.create(...)
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+DEFAULT_API_VERSION = "2024-06-01"
+
+
+def _env(*names: str, default: Optional[str] = None) -> Optional[str]:
+    for name in names:
+        value = os.getenv(name)
+        if value:
+            return value
+    return default
+
+
+def max_retries() -> int:
+    return int(_env("OPENAI_MAX_RETRIES", default="5"))
+
+
+def timeout() -> httpx.Timeout:
+    return httpx.Timeout(float(_env("OPENAI_TIMEOUT", default="60")), connect=10.0)
+
+
+def pool_limits() -> httpx.Limits:
+    max_connections = int(_env("OPENAI_MAX_CONNECTIONS", default="64"))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=120.0,
+    )
+
+
+def max_concurrency() -> int:
+    return int(_env("OPENAI_MAX_CONCURRENCY", default="16"))
+
+
+class _LimitedTransport(httpx.HTTPTransport):
+    """HTTP transport that caps concurrent requests per host."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = threading.BoundedSemaphore(max_concurrency())
+            return self._limits[host]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._semaphore(request.url.host):
+            return super().handle_request(request)
+
+
+class _AsyncLimitedTransport(httpx.AsyncHTTPTransport):
+    """Async HTTP transport that caps concurrent requests per host."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # asyncio.Semaphore binds to the loop that first waits on it.
+        self._limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limits = self._limits.setdefault(asyncio.get_running_loop(), {})
+        host = request.url.host
+        if host not in limits:
+            limits[host] = asyncio.Semaphore(max_concurrency())
+        async with limits[host]:
+            return await super().handle_async_request(request)
+
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_clients: Dict[Tuple, object] = {}
+# Per event loop; pooled connections keep their loop alive, so closed loops are dropped explicitly.
+_async_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_async_clients: Dict[asyncio.AbstractEventLoop, Dict[Tuple, object]] = {}
+
+
+def _reset_after_fork():
+    # Connections and locks must not be shared with a forked child.
+    global _lock, _http_client, _async_http_clients, _clients, _async_clients
+    _lock = threading.Lock()
+    _http_client = None
+    _async_http_clients = {}
+    _clients = {}
+    _async_clients = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def http_client() -> httpx.Client:
+    """Return the pooled HTTP client shared by every sync API client."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                transport=_LimitedTransport(limits=pool_limits()),
+                timeout=timeout(),
+            )
+        return _http_client
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _drop_closed_loops():
+    for cache in (_async_http_clients, _async_clients):
+        for loop in [loop for loop in cache if loop.is_closed()]:
+            del cache[loop]
+
+
+def _new_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=_AsyncLimitedTransport(limits=pool_limits()), timeout=timeout())
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """Return the pooled HTTP client shared by the async API clients of the running event loop.
+
+    Outside a running loop a new, unshared client is returned.
+    """
+    loop = _running_loop()
+    if loop is None:
+        return _new_async_http_client()
+    with _lock:
+        _drop_closed_loops()
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = _async_http_clients[loop] = _new_async_http_client()
+        return client
+
+
+def _settings(endpoint, api_key, api_version):
+    endpoint = endpoint or _env("AZURE_OPENAI_ENDPOINT", "AZURE_ENDPOINT")
+    if endpoint:
+        api_key = api_key or _env("AZURE_OPENAI_API_KEY", "AZURE_API_KEY")
+        api_version = api_version or _env("AZURE_OPENAI_API_VERSION", default=DEFAULT_API_VERSION)
+    else:
+        api_key = api_key or _env("OPENAI_API_KEY")
+        api_version = None
+    return endpoint, api_key, api_version
+
+
+def _get(is_async: bool, endpoint, api_key, api_version):
+    endpoint, api_key, api_version = _settings(endpoint, api_key, api_version)
+    key = (is_async, endpoint, api_key, api_version)
+    if is_async:
+        loop = _running_loop()
+        with _lock:
+            _drop_closed_loops()
+            # Without a running loop there is nothing to cache the client for.
+            cache = {} if loop is None else _async_clients.setdefault(loop, {})
+    else:
+        cache = _clients
+    client = cache.get(key)
+    if client is not None:
+        return client
+
+    import openai
+
+    http = async_http_client() if is_async else http_client()
+    common = dict(api_key=api_key, max_retries=max_retries(), timeout=timeout(), http_client=http)
+    if endpoint:
+        cls = openai.AsyncAzureOpenAI if is_async else openai.AzureOpenAI
+        client = cls(azure_endpoint=endpoint, api_version=api_version, **common)
+    else:
+        cls = openai.AsyncOpenAI if is_async else openai.OpenAI
+        client = cls(**common)
+    with _lock:
+        return cache.setdefault(key, client)
+
+
+def get_client(
+    endpoint: Optional[str] = None,
+    api_key: Optional[str] = None,
+    api_version: Optional[str] = None,
+):
+    """Return the shared sync client for an endpoint (Azure if an endpoint is configured)."""
+    return _get(False, endpoint, api_key, api_version)
+
+
+def get_async_client(
+    endpoint: Optional[str] = None,
+    api_key: Optional[str] = None,
+    api_version: Optional[str] = None,
+):
+    """Return the running event loop's shared async client for an endpoint (Azure if an endpoint is configured)."""
+    return _get(True, endpoint, api_key, api_version)
@@ -0,0 +1,595 @@
+"""
+Local stand-in for the OpenAI / Azure OpenAI and Azure AI Search REST APIs.
+
+Lets the embedding, chat and search code paths run and be load-tested with no
+network access. Modes:
+
+    fake     deterministic synthetic responses (default)
+    record   forward to --upstream and save every response in --cassette
+    replay   serve responses saved by a previous ``record`` run
+
+Served endpoints (both OpenAI and Azure URL layouts):
+
+    POST /v1/embeddings, /openai/deployments/{d}/embeddings
+    POST /v1/chat/completions, /openai/deployments/{d}/chat/completions
+    POST /indexes('{name}')/docs/search.post.search   (and /indexes/{name}/docs/search)
+    POST /indexes('{name}')/docs/search.index         (and /indexes/{name}/docs/index)
+    GET  /indexes('{name}')/docs/$count
+    GET  /_stats
+
+Fake embeddings hash the words of the input into the vector, so texts that
+share words get similar vectors. Fake search does simple term matching over
+documents pushed through the index endpoint or loaded with --search-data, and
+understands the OData filters used by the hotels UI (eq/ne/gt/ge/lt/le,
+and/or/not, parentheses).
+
+Latency, 429s and 5xx errors can be injected to exercise retry/backoff code.
+
+Usage:
+    python standin_server.py --port 8010 --latency-ms 20 --rate-429 0.05 \\
+        --search-data ../hotels/HotelsData_toAzureBlobs.json --index hotels-sample-index
+
+    # then point the clients at it
+    AZURE_OPENAI_ENDPOINT=http://localhost:8010 AZURE_OPENAI_API_KEY=x python azure_chat.py
+    AZURE_SEARCH_ENDPOINT=http://localhost:8010 AZURE_SEARCH_API_KEY=x streamlit run ...
+"""
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 1536
+
+_WORD = re.compile(r"\w+")
+_EMBEDDINGS = re.compile(r"^/(?:v1/|openai/deployments/([^/]+)/)?embeddings$")
+_CHAT = re.compile(r"^/(?:v1/|openai/deployments/([^/]+)/)?chat/completions$")
+_DOCS = re.compile(r"^/indexes(?:\('([^']+)'\)|/([^/]+))/docs/?(.*)$")
+
+
+# ---------------------------------------------------------------------------
+# Fake responses
+# ---------------------------------------------------------------------------
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def fake_embedding(text: str, dimensions: int = DEFAULT_DIMENSIONS) -> np.ndarray:
+    """Return a deterministic unit vector; texts sharing words get similar vectors."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    words = _WORD.findall(text.lower()) or [text]
+    for word, count in Counter(words).items():
+        h = _hash64(word)
+        vector[h % dimensions] += count if (h >> 63) else -count
+    # A small text-specific component keeps distinct texts distinct.
+    rng = np.random.default_rng(_hash64(text))
+    vector += (0.25 / np.sqrt(dimensions)) * rng.standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _n_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def fake_embeddings_response(body: dict, model: str) -> dict:
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or DEFAULT_DIMENSIONS
+    as_base64 = body.get("encoding_format") == "base64"
+    data = []
+    for i, text in enumerate(inputs):
+        if not isinstance(text, str):  # token IDs
+            text = " ".join(str(t) for t in text)
+        vector = fake_embedding(text, dimensions)
+        embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode() if as_base64 else vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(_n_tokens(t) if isinstance(t, str) else len(t) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": model,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def fake_chat_response(body: dict, model: str) -> dict:
+    messages = body.get("messages", [])
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if isinstance(last_user, list):  # content parts
+        last_user = " ".join(part.get("text", "") for part in last_user if isinstance(part, dict))
+    reply = f"[stand-in] You asked: {last_user}"
+    prompt_tokens = sum(_n_tokens(str(m.get("content", ""))) for m in messages)
+    completion_tokens = _n_tokens(reply)
+    return {
+        "id": f"chatcmpl-standin-{_hash64(json.dumps(messages, sort_keys=True)):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Minimal OData filters for the fake search index
+# ---------------------------------------------------------------------------
+
+_ODATA_TOKEN = re.compile(r"\s*(\(|\)|'(?:[^']|'')*'|[\w./]+)")
+
+
+def _lookup(doc: dict, path: str):
+    value = doc
+    for part in path.split("/"):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _literal(token: str):
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    if token in ("true", "false"):
+        return token == "true"
+    if token == "null":
+        return None
+    try:
+        return float(token)
+    except ValueError:
+        raise ValueError(f"unsupported OData literal: {token}")
+
+
+_COMPARISONS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "ge": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "le": lambda a, b: a is not None and a <= b,
+}
+
+
+def parse_filter(expression: str):
+    """Compile a small OData subset into a predicate over documents."""
+    tokens = _ODATA_TOKEN.findall(expression)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        left = parse_and()
+        while peek() == "or":
+            take()
+            right = parse_and()
+            left = (lambda l, r: lambda d: l(d) or r(d))(left, right)
+        return left
+
+    def parse_and():
+        left = parse_not()
+        while peek() == "and":
+            take()
+            right = parse_not()
+            left = (lambda l, r: lambda d: l(d) and r(d))(left, right)
+        return left
+
+    def parse_not():
+        if peek() == "not":
+            take()
+            inner = parse_not()
+            return lambda d: not inner(d)
+        return parse_atom()
+
+    def parse_atom():
+        if peek() == "(":
+            take()
+            inner = parse_or()
+            if take() != ")":
+                raise ValueError("unbalanced parentheses in filter")
+            return inner
+        field, op, literal = take(), take(), _literal(take())
+        if op not in _COMPARISONS:
+            raise ValueError(f"unsupported OData operator: {op}")
+        compare = _COMPARISONS[op]
+        return lambda d: compare(_lookup(d, field), literal)
+
+    try:
+        predicate = parse_or()
+    except IndexError:
+        raise ValueError(f"incomplete filter: {expression}")
+    if pos != len(tokens):
+        raise ValueError(f"could not parse filter: {expression}")
+    return predicate
+
+
+# ---------------------------------------------------------------------------
+# Fake search index
+# ---------------------------------------------------------------------------
+
+
+def _flatten_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(_flatten_text(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(_flatten_text(v) for v in value)
+    return ""
+
+
+class FakeIndex:
+    """In-memory documents for one search index."""
+
+    def __init__(self, key_field: Optional[str] = None):
+        self.key_field = key_field
+        self.docs: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def _key(self, doc: dict) -> str:
+        if self.key_field is None:
+            self.key_field = next(
+                (k for k in doc if k == "id" or k.endswith("Id")), next(iter(doc))
+            )
+        return str(doc[self.key_field])
+
+    def index(self, actions: List[dict]) -> List[dict]:
+        results = []
+        with self.lock:
+            for action in actions:
+                action = dict(action)
+                kind = action.pop("@search.action", "upload")
+                key = self._key(action)
+                status = 200
+                if kind == "delete":
+                    self.docs.pop(key, None)
+                elif kind == "upload":
+                    self.docs[key] = action
+                    status = 201
+                elif kind == "mergeOrUpload":
+                    status = 200 if key in self.docs else 201
+                    self.docs[key] = {**self.docs.get(key, {}), **action}
+                elif kind == "merge":
+                    if key not in self.docs:
+                        results.append({"key": key, "status": False, "errorMessage": "Document not found.", "statusCode": 404})
+                        continue
+                    self.docs[key].update(action)
+                results.append({"key": key, "status": True, "errorMessage": None, "statusCode": status})
+        return results
+
+    def search(self, body: dict) -> dict:
+        query = body.get("search") or "*"
+        terms = [] if query.strip() == "*" else _WORD.findall(query.lower())
+        predicate = parse_filter(body["filter"]) if body.get("filter") else None
+        with self.lock:
+            docs = list(self.docs.values())
+
+        hits = []
+        for doc in docs:
+            if predicate and not predicate(doc):
+                continue
+            if terms:
+                words = Counter(_WORD.findall(_flatten_text(doc).lower()))
+                score = sum(words[t] for t in terms)
+                if not score:
+                    continue
+            else:
+                score = 1.0
+            hits.append((float(score), doc))
+        hits.sort(key=lambda hit: -hit[0])
+
+        skip, top = int(body.get("skip") or 0), int(body.get("top") or 50)
+        select = body.get("select")
+        fields = [f.strip() for f in select.split(",")] if isinstance(select, str) else select
+        value = []
+        for score, doc in hits[skip : skip + top]:
+            out = {k: doc.get(k) for k in fields} if fields else dict(doc)
+            out["@search.score"] = score
+            value.append(out)
+        response = {"value": value}
+        if body.get("count"):
+            response["@odata.count"] = len(hits)
+        return response
+
+
+# ---------------------------------------------------------------------------
+# Record / replay and fault injection
+# ---------------------------------------------------------------------------
+
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """Return a stable cassette key; JSON bodies are canonicalized first."""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True).encode()
+    except ValueError:
+        pass
+    path = re.sub(r"[?&]api-version=[^&]*", "", path)
+    return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+
+
+class Cassette:
+    """A directory of recorded responses, one JSON file per request key."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path, key + ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, entry: dict):
+        tmp = os.path.join(self.path, key + ".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, os.path.join(self.path, key + ".json"))
+
+
+class Faults:
+    """Configurable latency and error injection, reproducible with a seed."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, rate_error=0.0, retry_after=1.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_error = rate_error
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return ``(delay_seconds, status_or_None)`` for the next request."""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self._rng.random()
+        if roll < self.rate_429:
+            return delay, 429
+        if roll < self.rate_429 + self.rate_error:
+            return delay, 503
+        return delay, None
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mode="fake", upstream=None, cassette=None, strict=False, faults=None, key_field=None):
+        super().__init__(address, _Handler)
+        if mode in ("record", "replay") and not cassette:
+            raise ValueError(f"{mode} mode needs a cassette directory")
+        if mode == "record" and not upstream:
+            raise ValueError("record mode needs an upstream URL")
+        self.mode = mode
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.cassette = Cassette(cassette) if cassette else None
+        self.strict = strict
+        self.faults = faults or Faults()
+        self.key_field = key_field
+        self.indexes: Dict[str, FakeIndex] = {}
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_index(self, name: str) -> FakeIndex:
+        with self.stats_lock:
+            if name not in self.indexes:
+                self.indexes[name] = FakeIndex(self.key_field)
+            return self.indexes[name]
+
+    def count(self, name: str):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandinServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # keep load tests quiet
+        pass
+
+    def _send(self, status: int, payload, headers: Optional[dict] = None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", (headers or {}).pop("Content-Type", "application/json"))
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send(status, {"error": {"code": str(status), "message": message}}, headers)
+
+    def do_GET(self):
+        self._handle(b"")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._handle(self.rfile.read(length))
+
+    def _handle(self, raw: bytes):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        if path == "/_stats":
+            with server.stats_lock:
+                return self._send(200, dict(server.stats))
+
+        server.count("requests")
+        delay, fault = server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if fault == 429:
+            server.count("throttled")
+            retry_after = server.faults.retry_after
+            return self._error(
+                429,
+                "Rate limit exceeded (stand-in).",
+                {"Retry-After": f"{retry_after:g}", "retry-after-ms": str(int(retry_after * 1000))},
+            )
+        if fault:
+            server.count("errors")
+            return self._error(fault, "Service unavailable (stand-in).")
+
+        if server.mode == "fake":
+            return self._fake(path, raw)
+
+        key = request_key(self.command, self.path, raw)
+        if server.mode == "replay":
+            entry = server.cassette.get(key)
+            if entry is not None:
+                server.count("replayed")
+                return self._send(entry["status"], base64.b64decode(entry["body"]), {"Content-Type": entry["content_type"]})
+            if server.strict:
+                return self._error(404, f"No recorded response for {self.command} {self.path}")
+            return self._fake(path, raw)
+
+        return self._record(key, raw)
+
+    def _record(self, key: str, raw: bytes):
+        server = self.server
+        forward = {k: v for k, v in self.headers.items() if k.lower() not in ("host", "content-length", "accept-encoding")}
+        request = urllib.request.Request(server.upstream + self.path, data=raw or None, headers=forward, method=self.command)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                status, body, content_type = response.status, response.read(), response.headers.get("Content-Type", "application/json")
+        except urllib.error.HTTPError as e:
+            status, body, content_type = e.code, e.read(), e.headers.get("Content-Type", "application/json")
+        except urllib.error.URLError as e:
+            return self._error(502, f"Upstream unreachable: {e.reason}")
+        if status < 500 and status != 429:
+            server.cassette.put(key, {"status": status, "content_type": content_type, "body": base64.b64encode(body).decode()})
+            server.count("recorded")
+        self._send(status, body, {"Content-Type": content_type})
+
+    def _fake(self, path: str, raw: bytes):
+        server = self.server
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            return self._error(400, "Request body is not valid JSON.")
+
+        match = _EMBEDDINGS.match(path)
+        if match:
+            server.count("embeddings")
+            return self._send(200, fake_embeddings_response(body, match.group(1) or body.get("model", "")))
+
+        match = _CHAT.match(path)
+        if match:
+            server.count("chat")
+            return self._send(200, fake_chat_response(body, match.group(1) or body.get("model", "")))
+
+        match = _DOCS.match(path)
+        if match:
+            index = server.get_index(match.group(1) or match.group(2))
+            operation = match.group(3)
+            if operation in ("search.post.search", "search"):
+                server.count("search")
+                try:
+                    return self._send(200, index.search(body))
+                except ValueError as e:
+                    return self._error(400, str(e))
+            if operation in ("search.index", "index"):
+                server.count("index")
+                results = index.index(body.get("value", []))
+                ok = all(r["status"] for r in results)
+                return self._send(200 if ok else 207, {"value": results})
+            if operation == "$count":
+                return self._send(200, str(len(index.docs)).encode(), {"Content-Type": "text/plain"})
+
+        self._error(404, f"No stand-in route for {self.command} {path}")
+
+
+@contextlib.contextmanager
+def running_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """Run a stand-in server on a background thread; yields the server (see ``.url``)."""
+    server = StandinServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline stand-in for OpenAI and Azure AI Search endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--mode", choices=["fake", "record", "replay"], default="fake")
+    parser.add_argument("--upstream", help="Real endpoint to forward to in record mode")
+    parser.add_argument("--cassette", help="Directory of recorded responses")
+    parser.add_argument("--strict", action="store_true", help="In replay mode, 404 instead of faking unknown requests")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-error", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--search-data", help="JSON array of documents to preload into --index")
+    parser.add_argument("--index", default="hotels-sample-index")
+    parser.add_argument("--key-field", default=None, help="Document key field (default: first 'id'/'...Id' field)")
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.rate_429, args.rate_error, args.retry_after, args.seed)
+    server = StandinServer(
+        (args.host, args.port),
+        mode=args.mode,
+        upstream=args.upstream,
+        cassette=args.cassette,
+        strict=args.strict,
+        faults=faults,
+        key_field=args.key_field,
+    )
+    if args.search_data:
+        with open(args.search_data, encoding="utf-8") as f:
+            server.get_index(args.index).index(json.load(f))
+    print(f"Stand-in server ({args.mode}) listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Approximate nearest-neighbor search over normalized embeddings (IVF).
+
+Vectors are clustered with k-means into ``n_lists`` inverted lists. A query
+scores only the rows of the ``nprobe`` lists whose centroids are closest to
+it. With a row mask (a metadata filter), traversal keeps probing lists in
+order of centroid similarity until at least ``k`` rows that pass the filter
+have been scored, so filtered queries still return ``k`` results.
+"""
+
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 unit-length rows (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return indices of the ``k`` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # Partition around the (n - k)th smallest instead of negating, so the
+    # only corpus-sized allocation is argpartition's index array.
+    n = len(scores)
+    part = np.argpartition(scores, n - k)[n - k :]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, sample_size: int = 50_000, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of ``vectors``; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    vectors = normalize_rows(vectors)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=n_clusters) == 0
+        # Re-seed empty clusters with random points.
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over a fixed matrix of unit-length vectors."""
+
+    def __init__(self, vectors: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0):
+        self.vectors = vectors
+        n = len(vectors)
+        self.n_lists = min(n_lists or max(1, int(np.sqrt(n))), n)
+        self.centroids = kmeans(vectors, self.n_lists, n_iter=n_iter, seed=seed)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65_536):  # bound the size of the score matrix
+            block = np.asarray(vectors[start : start + 65_536], dtype=np.float32)
+            assignment[start : start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        # Rows of list i are order[offsets[i]:offsets[i + 1]].
+        self.order = np.argsort(assignment, kind="stable")
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=self.n_lists), out=self.offsets[1:])
+
+    def list_sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        mask: Union[np.ndarray, Callable[[np.ndarray], np.ndarray], None] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Return ``(row ids, scores, rows scored)`` for the best ``k`` rows.
+
+        If ``mask`` is given, only rows where it is True are eligible, and
+        more than ``nprobe`` lists are visited when needed to find ``k`` of them.
+        ``mask`` may also be a function from row IDs to a boolean array, which
+        is then only evaluated on the rows of the probed lists.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        probe_order = np.argsort(-(self.centroids @ query))
+        candidates, found = [], 0
+        for probed, lst in enumerate(probe_order, 1):
+            rows = self.order[self.offsets[lst] : self.offsets[lst + 1]]
+            if callable(mask):
+                rows = rows[mask(rows)]
+            elif mask is not None:
+                rows = rows[mask[rows]]
+            candidates.append(rows)
+            found += len(rows)
+            if probed >= nprobe and found >= k:
+                break
+        rows = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best], len(rows)
@@ -0,0 +1,189 @@
+"""
+Token-aware chunking for long documents.
+
+Each document is tokenized once with tiktoken and split into overlapping,
+token-bounded chunks that prefer to end on a paragraph or sentence boundary.
+Every chunk keeps the character offsets of its text in the source document,
+so long inputs (PDFs, docs/*.md, very long reviews) can be split and embedded
+instead of being dropped.
+
+Usage:
+    python chunking.py ../../docs/*.md --max-tokens 512 --overlap 64
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_MAX_TOKENS = 8000  # the maximum for text-embedding-3-small is 8191
+DEFAULT_OVERLAP = 200
+
+# Batches of fewer documents than this are chunked in-process; a worker pool
+# would cost more to start than it saves.
+_PARALLEL_MIN_DOCS = 32
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A token-bounded slice of a document; ``text == document[start:end]``."""
+
+    doc_index: int
+    chunk_index: int
+    text: str
+    start: int
+    end: int
+    n_tokens: int
+
+
+_encoding_cache = {}
+
+
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """Return a tiktoken encoding, loading it at most once per process."""
+    if encoding_name not in _encoding_cache:
+        _encoding_cache[encoding_name] = tiktoken.get_encoding(encoding_name)
+    return _encoding_cache[encoding_name]
+
+
+def _boundary_tokens(text: str, offsets: np.ndarray, pattern: re.Pattern, use_end: bool) -> np.ndarray:
+    """Return sorted token indices at which a new paragraph/sentence starts."""
+    positions = [m.end() if use_end else m.start() for m in pattern.finditer(text)]
+    if not positions:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.searchsorted(offsets, positions, side="left"))
+
+
+def _last_boundary(boundaries: np.ndarray, lo: int, hi: int) -> Optional[int]:
+    """Return the largest boundary in ``(lo, hi]``, or None."""
+    i = np.searchsorted(boundaries, hi, side="right")
+    if i and boundaries[i - 1] > lo:
+        return int(boundaries[i - 1])
+    return None
+
+
+def _first_boundary(boundaries: np.ndarray, lo: int, hi: int) -> Optional[int]:
+    """Return the smallest boundary in ``[lo, hi)``, or None."""
+    i = np.searchsorted(boundaries, lo, side="left")
+    if i < len(boundaries) and boundaries[i] < hi:
+        return int(boundaries[i])
+    return None
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+    encoding_name: str = DEFAULT_ENCODING,
+    doc_index: int = 0,
+) -> List[Chunk]:
+    """Split one document into overlapping chunks of at most ``max_tokens`` tokens."""
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive")
+    if not 0 <= overlap < max_tokens:
+        raise ValueError("overlap must be in [0, max_tokens)")
+
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode_ordinary(text)
+    n = len(tokens)
+    if n == 0:
+        return []
+    if n <= max_tokens:
+        return [Chunk(doc_index, 0, text, 0, len(text), n)]
+
+    _, token_offsets = encoding.decode_with_offsets(tokens)
+    offsets = np.asarray(token_offsets, dtype=np.int64)
+    paragraphs = _boundary_tokens(text, offsets, _PARAGRAPH_BREAK, use_end=True)
+    sentences = _boundary_tokens(text, offsets, _SENTENCE_BREAK, use_end=False)
+
+    def char_offset(token_index: int) -> int:
+        return len(text) if token_index >= n else int(offsets[token_index])
+
+    chunks = []
+    start = 0
+    # Only look for a natural break in the back half of the window, so a
+    # boundary near the start never produces a tiny chunk.
+    min_len = max(1, max_tokens // 2)
+    while start < n:
+        end = min(start + max_tokens, n)
+        if end < n:
+            lo = start + min_len
+            end = (
+                _last_boundary(paragraphs, lo, end)
+                or _last_boundary(sentences, lo, end)
+                or end
+            )
+        start_char, end_char = char_offset(start), char_offset(end)
+        chunks.append(
+            Chunk(doc_index, len(chunks), text[start_char:end_char], start_char, end_char, end - start)
+        )
+        if end >= n:
+            break
+        # Step back by the overlap, then forward to a sentence start if one
+        # falls inside the overlap window.
+        next_start = max(end - overlap, start + 1)
+        if overlap:
+            next_start = _first_boundary(sentences, next_start, end) or next_start
+        start = next_start
+    return chunks
+
+
+def _chunk_job(args):
+    doc_index, text, max_tokens, overlap, encoding_name = args
+    return chunk_text(text, max_tokens, overlap, encoding_name, doc_index=doc_index)
+
+
+def chunk_documents(
+    texts: Sequence[str],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+    encoding_name: str = DEFAULT_ENCODING,
+    workers: Optional[int] = None,
+) -> List[List[Chunk]]:
+    """Chunk many documents, spreading the work over a process pool.
+
+    Returns one list of chunks per input document, in input order.
+    """
+    jobs = [(i, text, max_tokens, overlap, encoding_name) for i, text in enumerate(texts)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < _PARALLEL_MIN_DOCS:
+        return [_chunk_job(job) for job in jobs]
+
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_chunk_job, jobs, chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split text files into token-bounded chunks (JSON lines on stdout).")
+    parser.add_argument("paths", nargs="+", help="Text or markdown files to chunk")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    parser.add_argument("--encoding", default=DEFAULT_ENCODING)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    texts = []
+    for path in args.paths:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+
+    results = chunk_documents(texts, args.max_tokens, args.overlap, args.encoding, args.workers)
+    for path, chunks in zip(args.paths, results):
+        for chunk in chunks:
+            sys.stdout.write(json.dumps({"source": path, **asdict(chunk)}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
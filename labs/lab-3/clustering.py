@@ -0,0 +1,257 @@
+"""
+Mini-batch k-means topic clusters over the embedding store.
+
+Groups reviews into themes (delivery complaints, spoilage, pet food, ...)
+without loading the whole matrix into RAM:
+
+1. centroids are seeded with spherical k-means on a random sample of rows;
+2. ``n_passes`` streaming passes read each segment's memory-mapped vectors in
+   shuffled mini-batches and move every centroid towards its batch members
+   with a per-centroid learning rate of 1 / (points seen) (Sculley, 2010);
+3. a final pass assigns every live row to its nearest centroid.
+
+Centroids, per-centroid counts, the embedding model and dimensions they were
+fit on, and assignments (``id``, ``chunk``, ``content_hash`` -> ``cluster``,
+``similarity``) are saved next to the store.
+:meth:`ReviewClusters.update` processes only rows whose (id, chunk, content
+hash) has no assignment yet, i.e. new or edited reviews, continuing the
+mini-batch updates with them and dropping assignments of deleted reviews.
+Compaction does not change keys, so compacted rows are not reprocessed.
+Once the store cuts over to another model (see ``reembed.py``) the saved
+centroids live in the wrong vector space, so ``--update`` refits instead.
+
+Usage:
+    python clustering.py data/reviews_store --clusters 8          # fit and label
+    python clustering.py data/reviews_store --update              # after new ingests
+"""
+
+import argparse
+import json
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ann_index import kmeans, normalize_rows
+from vector_store import LEGACY_MODEL, VectorStore
+
+CLUSTER_DIR = "clusters"
+KEY_COLUMNS = ["id", "chunk", "content_hash"]
+
+
+def _keys(metadata: pd.DataFrame) -> pd.DataFrame:
+    keys = pd.DataFrame({"id": metadata["id"].astype(str), "content_hash": metadata["content_hash"].astype(str)})
+    keys["chunk"] = metadata["chunk"].to_numpy() if "chunk" in metadata else 0
+    return keys[KEY_COLUMNS]
+
+
+def iter_minibatches(store: VectorStore, batch_size: int, rng: np.random.Generator, skip: Optional[pd.DataFrame] = None) -> Iterator:
+    """Yield ``(keys, vectors)`` mini-batches of live rows, segment by segment in random order.
+
+    Rows whose keys appear in ``skip`` are left out. Each batch reads sorted
+    row numbers from one memory-mapped segment.
+    """
+    segments = list(store.iter_segments())
+    for i in rng.permutation(len(segments)):
+        seg = segments[i]
+        keys = _keys(seg.metadata)
+        wanted = seg.live.copy()
+        if skip is not None and len(skip):
+            wanted &= ~keys.merge(skip[KEY_COLUMNS], how="left", indicator=True)["_merge"].eq("both").to_numpy()
+        rows = rng.permutation(np.flatnonzero(wanted))
+        for start in range(0, len(rows), batch_size):
+            batch = np.sort(rows[start : start + batch_size])
+            yield keys.iloc[batch].reset_index(drop=True), np.asarray(seg.vectors[batch], dtype=np.float32)
+
+
+def sample_rows(store: VectorStore, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Uniform sample of ``n`` live vectors across all segments."""
+    segments = list(store.iter_segments())
+    live = np.array([int(seg.live.sum()) for seg in segments])
+    picks = np.sort(rng.choice(live.sum(), min(n, int(live.sum())), replace=False))
+    offsets = np.concatenate([[0], np.cumsum(live)])
+    parts = []
+    for seg, lo, hi in zip(segments, offsets[:-1], offsets[1:]):
+        mine = picks[(picks >= lo) & (picks < hi)] - lo
+        parts.append(np.asarray(seg.vectors[np.flatnonzero(seg.live)[mine]], dtype=np.float32))
+    return np.concatenate(parts)
+
+
+class ReviewClusters:
+    """Spherical mini-batch k-means centroids plus the assignment of every review row."""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        counts: Optional[np.ndarray] = None,
+        assignments: Optional[pd.DataFrame] = None,
+        model: Optional[str] = None,
+    ):
+        self.centroids = normalize_rows(centroids)
+        self.model = model
+        self.counts = np.zeros(len(centroids), dtype=np.int64) if counts is None else counts
+        self.assignments = (
+            assignments if assignments is not None else pd.DataFrame(columns=KEY_COLUMNS + ["cluster", "similarity"])
+        )
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def dims(self) -> int:
+        return self.centroids.shape[1]
+
+    def matches(self, store: VectorStore) -> bool:
+        """Whether the centroids were fit on vectors of the model and size ``store`` serves."""
+        return self.model == store.model and self.dims == store.dims
+
+    def predict(self, vectors: np.ndarray):
+        """Return ``(cluster, cosine similarity to its centroid)`` per row."""
+        scores = normalize_rows(vectors) @ self.centroids.T
+        cluster = np.argmax(scores, axis=1)
+        return cluster, scores[np.arange(len(cluster)), cluster]
+
+    def partial_fit(self, vectors: np.ndarray) -> np.ndarray:
+        """One mini-batch k-means step; returns the batch's cluster assignments."""
+        vectors = normalize_rows(vectors)
+        cluster, _ = self.predict(vectors)
+        batch_counts = np.bincount(cluster, minlength=self.n_clusters)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, cluster, vectors)
+        touched = batch_counts > 0
+        self.counts += batch_counts
+        # c <- c + (sum(x) - m * c) / v, i.e. the running mean with rate 1/v per point.
+        step = (sums[touched] - batch_counts[touched, None] * self.centroids[touched]) / self.counts[touched, None]
+        self.centroids[touched] = normalize_rows(self.centroids[touched] + step)
+        return cluster
+
+    @classmethod
+    def fit(
+        cls,
+        store: VectorStore,
+        n_clusters: int = 8,
+        n_passes: int = 3,
+        batch_size: int = 4096,
+        sample_size: int = 20_000,
+        seed: int = 0,
+    ) -> "ReviewClusters":
+        """Seed on a sample, run ``n_passes`` streaming passes, then assign every row."""
+        rng = np.random.default_rng(seed)
+        model = cls(kmeans(sample_rows(store, sample_size, rng), n_clusters, seed=seed), model=store.model)
+        for _ in range(n_passes):
+            for _, vectors in iter_minibatches(store, batch_size, rng):
+                model.partial_fit(vectors)
+        model.assign(store, batch_size)
+        return model
+
+    def assign(self, store: VectorStore, batch_size: int = 4096, only_new: bool = False) -> int:
+        """Assign live rows to clusters; with ``only_new``, just rows without an assignment.
+
+        Assignments of rows that are no longer live are dropped. Returns the
+        number of rows assigned.
+        """
+        rng = np.random.default_rng(0)
+        skip = self.assignments if only_new else None
+        frames = []
+        for keys, vectors in iter_minibatches(store, batch_size, rng, skip=skip):
+            if only_new:
+                self.partial_fit(vectors)  # let new reviews move the centroids too
+            cluster, similarity = self.predict(vectors)
+            frames.append(keys.assign(cluster=cluster, similarity=similarity))
+
+        live = pd.concat([_keys(seg.metadata[seg.live]) for seg in store.iter_segments()], ignore_index=True)
+        kept = self.assignments.merge(live, on=KEY_COLUMNS) if only_new and len(self.assignments) else None
+        self.assignments = pd.concat(([kept] if kept is not None else []) + frames, ignore_index=True)
+        return sum(len(f) for f in frames)
+
+    def update(self, store: VectorStore, batch_size: int = 4096) -> int:
+        """Fold new or changed reviews into the clusters; returns how many rows were added."""
+        if not self.matches(store):
+            raise ValueError(
+                f"clusters were fit on {self.model} ({self.dims} dims) but the store serves "
+                f"{store.model} ({store.dims} dims); refit them"
+            )
+        return self.assign(store, batch_size, only_new=True)
+
+    def sizes(self) -> np.ndarray:
+        return np.bincount(self.assignments["cluster"].astype(int), minlength=self.n_clusters)
+
+    def labels(self, metadata: pd.DataFrame, n: int = 3, text_column: str = "Summary") -> pd.DataFrame:
+        """Per cluster: size and the ``n`` reviews closest to the centroid (from ``metadata``)."""
+        best = (
+            self.assignments.sort_values("similarity", ascending=False)
+            .groupby("cluster", sort=True)
+            .head(n)
+            .merge(_keys(metadata).assign(text=metadata[text_column].astype(str).to_numpy()), on=KEY_COLUMNS)
+        )
+        representatives = best.groupby("cluster")["text"].apply(list)
+        sizes = self.sizes()
+        return pd.DataFrame(
+            {
+                "size": sizes,
+                "representatives": [representatives.get(c, []) for c in range(self.n_clusters)],
+            }
+        ).rename_axis("cluster")
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "counts.npy"), self.counts)
+        with open(os.path.join(path, "model.json"), "w") as f:
+            json.dump({"model": self.model, "dims": self.dims}, f)
+        tmp = os.path.join(path, "assignments.csv.tmp")
+        self.assignments.to_csv(tmp, index=False)
+        os.replace(tmp, os.path.join(path, "assignments.csv"))
+
+    @classmethod
+    def load(cls, path: str) -> "ReviewClusters":
+        assignments = pd.read_csv(
+            os.path.join(path, "assignments.csv"), dtype={"id": str, "content_hash": str}
+        )
+        try:
+            with open(os.path.join(path, "model.json")) as f:
+                model = json.load(f)["model"]
+        except FileNotFoundError:
+            model = LEGACY_MODEL  # saved before clusters were tagged, like untagged store segments
+        return cls(
+            np.load(os.path.join(path, "centroids.npy")),
+            np.load(os.path.join(path, "counts.npy")),
+            assignments,
+            model,
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Cluster the reviews of an embedding store into topics.")
+    parser.add_argument("store", help="Directory of the embedding store")
+    parser.add_argument("--clusters", type=int, default=8, help="Number of topics")
+    parser.add_argument("--passes", type=int, default=3, help="Streaming mini-batch passes over the store")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--update", action="store_true", help="Only fold in reviews added since the last run")
+    parser.add_argument("--out", help=f"Where to keep the clusters (default: <store>/{CLUSTER_DIR})")
+    parser.add_argument("--text-column", default="Summary", help="Metadata column shown for representatives")
+    args = parser.parse_args(argv)
+
+    store = VectorStore(args.store)
+    out = args.out or os.path.join(args.store, CLUSTER_DIR)
+    clusters = ReviewClusters.load(out) if args.update else None
+    if clusters is not None and not clusters.matches(store):
+        print(f"Clusters were fit on {clusters.model} ({clusters.dims} dims), the store now serves "
+              f"{store.model} ({store.dims} dims); refitting {clusters.n_clusters} clusters")
+        clusters = ReviewClusters.fit(store, clusters.n_clusters, args.passes, args.batch_size)
+    elif clusters is not None:
+        print(f"Assigned {clusters.update(store, args.batch_size)} new rows")
+    else:
+        clusters = ReviewClusters.fit(store, args.clusters, args.passes, args.batch_size)
+    clusters.save(out)
+
+    metadata = pd.concat([seg.metadata[seg.live] for seg in store.iter_segments()], ignore_index=True)
+    labels = clusters.labels(metadata, text_column=args.text_column)
+    for cluster, row in labels.iterrows():
+        print(f"[{cluster}] {row['size']} reviews: " + json.dumps(row["representatives"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Exact and near-duplicate detection for texts before embedding.
+
+Review datasets repeat the same Summary/Text across products, so embedding
+every row pays for the same vector many times. ``find_duplicates`` maps each
+text to a representative whose vector it may reuse:
+
+1. identical texts share a representative;
+2. when ``groups`` (e.g. ``ProductId``) are given, the remaining distinct
+   texts get MinHash signatures over word shingles, and LSH banding proposes
+   candidates *within the same group* whose estimated Jaccard similarity is
+   then checked against ``threshold``. Reviews of different products are
+   never merged, however similar their wording.
+
+A text joins a representative only if it is similar to that representative
+itself, so near-duplicates never chain into clusters of unrelated texts.
+
+``embed_deduplicated`` embeds one representative per cluster and fans the
+vector back out to every member. Given a :class:`DuplicateIndex`, it also
+reuses the vectors of representatives from earlier calls (e.g. earlier
+ingest batches) under the same rules, and remembers its own.
+"""
+
+import re
+import zlib
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE_SIZE = 3
+MAX_RUNNING_HEADS = 10_000  # representatives kept across calls, with their vectors (~60 MB at 1536 dims)
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _shingle_hashes(words: List[str], size: int) -> np.ndarray:
+    if len(words) < size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64))
+
+
+class MinHasher:
+    """MinHash signatures using multiply-shift hashing (one hash per permutation)."""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingle_hashes(normalize(text).split(), self.shingle_size)
+        with np.errstate(over="ignore"):
+            hashed = (shingles[:, None] * self._a + self._b) >> np.uint64(32)
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        return np.stack([self.signature(t) for t in texts]) if len(texts) else np.empty((0, len(self._a)), np.uint32)
+
+
+def find_duplicates(
+    texts: Sequence[str],
+    threshold: float = DEFAULT_THRESHOLD,
+    groups: Optional[Sequence] = None,
+    num_perm: int = DEFAULT_NUM_PERM,
+    bands: int = DEFAULT_BANDS,
+    shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    seed: int = 1,
+) -> np.ndarray:
+    """Return, for each text, the index of the text whose vector it reuses.
+
+    Representatives are the earliest text of their cluster, so
+    ``result[i] == i`` for texts that need embedding. Without ``groups``, or
+    with ``threshold >= 1``, only identical texts are deduplicated.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be a multiple of bands")
+    n = len(texts)
+    representative = np.arange(n)
+
+    # 1. Identical texts.
+    first_seen = {}
+    for i, text in enumerate(texts):
+        representative[i] = first_seen.setdefault(text, i)
+    distinct = np.flatnonzero(representative == np.arange(n))
+    if groups is None or threshold >= 1 or len(distinct) < 2:
+        return representative
+
+    # 2. Near duplicates among the distinct texts of each group: MinHash + LSH banding.
+    signatures = MinHasher(num_perm, shingle_size, seed).signatures([texts[i] for i in distinct])
+    rows = num_perm // bands
+    heads = {}  # (band, group, band signature) -> representatives seen in that bucket
+    head_of = np.arange(len(distinct))
+    for j, i in enumerate(distinct):
+        keys = [
+            (band, groups[i], signatures[j, band * rows : (band + 1) * rows].tobytes())
+            for band in range(bands)
+        ]
+        candidates = sorted({h for key in keys for h in heads.get(key, ())})
+        if candidates:
+            # Compare against representatives only, so every member is close to its own head.
+            similarity = (signatures[candidates] == signatures[j]).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                head_of[j] = candidates[best]
+                continue
+        for key in keys:
+            heads.setdefault(key, []).append(j)
+
+    return distinct[head_of][np.searchsorted(distinct, representative)]
+
+
+class DuplicateIndex:
+    """Representatives of earlier batches, so that duplicates across batches reuse their vectors.
+
+    Holds the text, MinHash signature, key and vector of at most
+    ``max_heads`` representatives; the groups used least recently are
+    forgotten first. Not thread-safe.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_heads: int = MAX_RUNNING_HEADS,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_heads = max_heads
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self._exact: "OrderedDict[str, tuple]" = OrderedDict()  # text -> (key, vector)
+        # group -> (signatures, (key, vector) per head, band bucket -> head positions)
+        self._groups: "OrderedDict[object, tuple]" = OrderedDict()
+        self._signed = 0
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [(band, signature[band * self.rows : (band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def lookup(self, text: str, group=None) -> Optional[tuple]:
+        """``(key, vector)`` of an earlier representative that ``text`` may reuse, or None."""
+        hit = self._exact.get(text)
+        if hit is not None:
+            self._exact.move_to_end(text)
+            return hit
+        entry = self._groups.get(group) if group is not None and self.threshold < 1 else None
+        if entry is None:
+            return None
+        self._groups.move_to_end(group)
+        signatures, heads, buckets = entry
+        signature = self.hasher.signature(text)
+        candidates = sorted({h for key in self._band_keys(signature) for h in buckets.get(key, ())})
+        if not candidates:
+            return None
+        similarity = (np.stack([signatures[c] for c in candidates]) == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        return heads[candidates[best]] if similarity[best] >= self.threshold else None
+
+    def add(self, text: str, key, vector: np.ndarray, group=None):
+        """Remember a newly embedded representative."""
+        head = (key, vector)
+        self._exact[text] = head
+        while len(self._exact) > self.max_heads:
+            self._exact.popitem(last=False)
+        if group is None or self.threshold >= 1:
+            return
+        signatures, heads, buckets = self._groups.setdefault(group, ([], [], {}))
+        self._groups.move_to_end(group)
+        signature = self.hasher.signature(text)
+        for band_key in self._band_keys(signature):
+            buckets.setdefault(band_key, []).append(len(heads))
+        signatures.append(signature)
+        heads.append(head)
+        self._signed += 1
+        while self._signed > self.max_heads and len(self._groups) > 1:
+            _, (evicted, _, _) = self._groups.popitem(last=False)
+            self._signed -= len(evicted)
+
+
+def embed_deduplicated(
+    texts: Sequence[str],
+    embed: Callable[[List[str]], np.ndarray],
+    keys: Optional[Sequence] = None,
+    groups: Optional[Sequence] = None,
+    index: Optional[DuplicateIndex] = None,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed one representative per duplicate cluster and fan the vectors out.
+
+    ``groups`` and ``kwargs`` go to :func:`find_duplicates`. With ``index``,
+    representatives found there are not embedded again, and the newly
+    embedded ones are added to it. Returns ``(vectors, source)`` where
+    ``vectors[i]`` is the embedding of the text keyed ``source[i]``; keys
+    default to positions in ``texts``.
+    """
+    keys = np.arange(len(texts)) if keys is None else np.asarray(keys)
+    if not len(texts):
+        return np.empty((0, 0), dtype=np.float32), keys
+    representative = find_duplicates(texts, groups=groups, **kwargs)
+    unique, inverse = np.unique(representative, return_inverse=True)
+    group_of = (lambda i: None) if groups is None else (lambda i: groups[i])
+    earlier = [index.lookup(texts[i], group_of(i)) if index is not None else None for i in unique]
+    new = [i for i, hit in zip(unique, earlier) if hit is None]
+    fresh = iter(np.asarray(embed([texts[i] for i in new]), dtype=np.float32) if new else ())
+
+    head_keys, head_vectors = [], []
+    for i, hit in zip(unique, earlier):
+        if hit is None:
+            hit = (keys[i], next(fresh).copy())  # a copy, so the index does not pin the whole batch
+            if index is not None:
+                index.add(texts[i], hit[0], hit[1], group_of(i))
+        head_keys.append(hit[0])
+        head_vectors.append(hit[1])
+    return np.stack(head_vectors)[inverse], np.array(head_keys)[inverse]
@@ -0,0 +1,229 @@
+"""
+Metadata-filtered vector search over the review corpus.
+
+Filtering the dataframe after a top-k search throws results away and forces
+over-fetching. Instead, the corpus keeps columnar indexes on the filterable
+metadata (``Score``, ``ProductId``, ``UserId`` by default), and a small
+planner picks one of two strategies per query from the estimated number of
+matching rows:
+
+    prefilter  resolve the filter to row IDs, then score only those rows
+               exactly (best for selective filters, e.g. one ProductId)
+    ann        IVF search that skips non-matching rows while traversing and
+               keeps probing lists until k matches are found (best for
+               broad filters, e.g. Score >= 4)
+
+Both return exactly ``k`` results whenever at least ``k`` rows match.
+
+Filters are a dict of column -> condition:
+
+    {"Score": 1}                  equality
+    {"ProductId": ["B001", ...]}  membership
+    {"Score": (4, None)}          inclusive range on a numeric column, None for an open end
+
+Filters on other columns, or ranges on non-numeric ones, raise ``ValueError``.
+
+Usage:
+    corpus = FilteredSearch.from_store(VectorStore("data/reviews_store"))
+    corpus.search(get_embedding("bad delivery"), k=3, filters={"Score": 1})
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ann_index import IVFIndex, normalize_rows, top_k
+
+DEFAULT_FILTER_COLUMNS = ("ProductId", "UserId", "Score")
+
+# Below this many rows an exact scan is always cheaper than building and probing an IVF index.
+MIN_ANN_ROWS = 10_000
+
+
+class SearchResult(NamedTuple):
+    rows: np.ndarray  # row positions in the corpus, best first
+    scores: np.ndarray  # cosine similarities
+    plan: str  # "prefilter", "ann" or "exact"
+    rows_scored: int
+
+
+class MetadataIndex:
+    """Columnar indexes for equality, membership and range filters."""
+
+    def __init__(self, metadata: pd.DataFrame, columns: Sequence[str] = DEFAULT_FILTER_COLUMNS):
+        self.n_rows = len(metadata)
+        self.values: Dict[str, np.ndarray] = {}
+        self.postings: Dict[str, Dict[object, np.ndarray]] = {}
+        self.sorted: Dict[str, tuple] = {}
+        self.codes: Dict[str, tuple] = {}
+        for column in columns:
+            values = metadata[column].to_numpy()
+            self.values[column] = values
+            # Integer code per row plus value -> code, for vectorized equality and membership checks.
+            codes, uniques = pd.factorize(values)
+            self.codes[column] = (codes, {value: code for code, value in enumerate(uniques)})
+            # Value -> sorted row IDs, for equality and membership.
+            self.postings[column] = {
+                key: np.asarray(rows, dtype=np.int64) for key, rows in pd.Series(values).groupby(values).indices.items()
+            }
+            if np.issubdtype(values.dtype, np.number):
+                order = np.argsort(values, kind="stable")
+                self.sorted[column] = (values[order], order)
+
+    def _condition_rows(self, column: str, condition) -> np.ndarray:
+        if isinstance(condition, tuple):
+            sorted_values, order = self.sorted[column]
+            lo, hi = condition
+            start = 0 if lo is None else np.searchsorted(sorted_values, lo, side="left")
+            end = len(sorted_values) if hi is None else np.searchsorted(sorted_values, hi, side="right")
+            return np.sort(order[start:end])
+        postings = self.postings[column]
+        if isinstance(condition, (list, set, np.ndarray)):
+            parts = [postings[v] for v in condition if v in postings]
+            return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        return postings.get(condition, np.empty(0, dtype=np.int64))
+
+    def _condition_count(self, column: str, condition) -> int:
+        if isinstance(condition, tuple):
+            sorted_values, _ = self.sorted[column]
+            lo, hi = condition
+            start = 0 if lo is None else np.searchsorted(sorted_values, lo, side="left")
+            end = len(sorted_values) if hi is None else np.searchsorted(sorted_values, hi, side="right")
+            return int(end - start)
+        postings = self.postings[column]
+        if isinstance(condition, (list, set, np.ndarray)):
+            return sum(len(postings[v]) for v in condition if v in postings)
+        return len(postings.get(condition, ()))
+
+    def _condition_matcher(self, column: str, condition) -> Callable[[np.ndarray], np.ndarray]:
+        if isinstance(condition, tuple):
+            values = self.values[column]
+            lo, hi = condition
+
+            def in_range(rows: np.ndarray) -> np.ndarray:
+                keep = np.ones(len(rows), dtype=bool)
+                if lo is not None:
+                    keep &= values[rows] >= lo
+                if hi is not None:
+                    keep &= values[rows] <= hi
+                return keep
+
+            return in_range
+        codes, code_of = self.codes[column]
+        # One slot per code plus a final False one, which code -1 (missing values) lands on.
+        allowed = np.zeros(len(code_of) + 1, dtype=bool)
+        wanted = condition if isinstance(condition, (list, set, np.ndarray)) else [condition]
+        allowed[[code_of[v] for v in wanted if v in code_of]] = True
+        return lambda rows: allowed[codes[rows]]
+
+    def matcher(self, filters: Dict[str, object]) -> Callable[[np.ndarray], np.ndarray]:
+        """Function mapping row IDs to a mask of those matching all filters, reading only their values."""
+        matchers = [self._condition_matcher(column, condition) for column, condition in filters.items()]
+
+        def matches(rows: np.ndarray) -> np.ndarray:
+            keep = np.ones(len(rows), dtype=bool)
+            for match in matchers:
+                keep &= match(rows)
+            return keep
+
+        return matches
+
+    def validate(self, filters: Dict[str, object]):
+        """Raise ``ValueError`` for filters on unindexed columns or ranges on non-numeric ones."""
+        for column, condition in filters.items():
+            if column not in self.values:
+                raise ValueError(f"cannot filter on {column!r}; indexed columns are {sorted(self.values)}")
+            if isinstance(condition, tuple):
+                if len(condition) != 2:
+                    raise ValueError(f"range filter on {column!r} must be a (low, high) pair")
+                if column not in self.sorted:
+                    raise ValueError(f"range filter on non-numeric column {column!r}")
+
+    def estimate(self, filters: Dict[str, object]) -> float:
+        """Estimated number of matching rows, assuming independent columns."""
+        estimate = float(self.n_rows)
+        for column, condition in filters.items():
+            estimate *= self._condition_count(column, condition) / max(self.n_rows, 1)
+        return estimate
+
+    def rows(self, filters: Dict[str, object]) -> np.ndarray:
+        """Exact sorted row IDs matching all filters.
+
+        Starts from the most selective condition and checks the others
+        against the columnar values of the surviving rows only.
+        """
+        ordered = sorted(filters.items(), key=lambda item: self._condition_count(*item))
+        (column, condition), rest = ordered[0], ordered[1:]
+        rows = self._condition_rows(column, condition)
+        if len(rows) and rest:
+            rows = rows[self.matcher(dict(rest))(rows)]
+        return rows
+
+
+
+class FilteredSearch:
+    """Read-only corpus of normalized vectors + metadata with filtered top-k search."""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        metadata: pd.DataFrame,
+        filter_columns: Sequence[str] = DEFAULT_FILTER_COLUMNS,
+        nprobe: int = 8,
+        ann: Optional[IVFIndex] = None,
+    ):
+        self.vectors = normalize_rows(vectors)
+        self.vectors.flags.writeable = False
+        self.metadata = metadata.reset_index(drop=True)
+        self.index = MetadataIndex(self.metadata, filter_columns)
+        self.nprobe = nprobe
+        if ann is None and len(self.vectors) >= MIN_ANN_ROWS:
+            ann = IVFIndex(self.vectors)
+        self.ann = ann
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "FilteredSearch":
+        """Build from the live rows of a ``VectorStore``."""
+        metadata, vectors = store.load_live()
+        return cls(vectors, metadata, **kwargs)
+
+    def plan(self, k: int, filters: Optional[Dict[str, object]]) -> str:
+        """Choose the cheaper strategy by the number of rows each would score."""
+        n = len(self.vectors)
+        matches = self.index.estimate(filters) if filters else n
+        if self.ann is None:
+            return "prefilter" if filters else "exact"
+        # ANN scores about nprobe/n_lists of the corpus, and with a filter
+        # must visit enough lists to see k matching rows.
+        ann_fraction = max(self.nprobe / self.ann.n_lists, k / max(matches, 1))
+        ann_cost = min(1.0, ann_fraction) * n
+        if filters and matches <= ann_cost:
+            return "prefilter"
+        return "ann"
+
+    def search(self, query, k: int = 3, filters: Optional[Dict[str, object]] = None) -> SearchResult:
+        if filters:
+            self.index.validate(filters)
+        query = normalize_rows(np.asarray(query, dtype=np.float32))
+        plan = self.plan(k, filters)
+        if plan == "ann":
+            # Broad filters are checked on the probed lists only, never over the whole corpus.
+            mask = self.index.matcher(filters) if filters else None
+            rows, scores, scored = self.ann.search(query, k, self.nprobe, mask)
+            return SearchResult(rows, scores, plan, scored)
+
+        rows = self.index.rows(filters) if filters else np.arange(len(self.vectors))
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return SearchResult(rows[best], scores[best], plan, len(rows))
+
+    def search_frame(
+        self, query, k: int = 3, filters: Optional[Dict[str, object]] = None, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """Like :meth:`search`, returning the matching metadata rows with a ``similarity`` column."""
+        result = self.search(query, k, filters)
+        frame = self.metadata.iloc[result.rows]
+        if columns:
+            frame = frame[columns]
+        return frame.assign(similarity=result.scores)
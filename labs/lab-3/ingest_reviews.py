@@ -0,0 +1,350 @@
+"""
+Streaming, resumable ingestion of review CSVs into a VectorStore.
+
+Reads the source CSV in chunks and pushes each chunk through
+
+    clean -> combine -> tokenize -> embed -> store
+
+as a pipeline of threads joined by small bounded queues, so at most a few
+chunks are in memory at any time regardless of input size. Every stored
+segment commits the number of source rows consumed so far; rerunning the
+same command after a crash resumes from that point.
+
+The store is updated incrementally: each review is keyed by its source row
+ID and a hash of its combined text, and only new or changed reviews are
+embedded. Rows flagged by ``--deleted-column`` (e.g. ``IsDeleted``) are
+tombstoned. ``--refresh`` rescans the whole source, which then costs as much
+as the delta rather than the whole corpus.
+
+Identical reviews, and near-identical reviews of the same product, are
+embedded once and share the vector (see ``dedup.py``), within a batch and
+across the recent batches of a run.
+
+Reviews longer than ``--max-tokens`` are split with ``chunking.chunk_text``
+instead of being dropped. Unlike the notebook, rows are kept in source order
+(no global sort by ``Time``), since sorting would require reading the whole
+file.
+
+Usage:
+    python ingest_reviews.py data/fine_food_reviews_1k.csv data/reviews_store
+    python ingest_reviews.py data/fine_food_reviews_1k.csv data/reviews_store --refresh --compact
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import dotenv
+import numpy as np
+import pandas as pd
+
+from chunking import DEFAULT_ENCODING, chunk_text
+from dedup import DEFAULT_THRESHOLD, DuplicateIndex, embed_deduplicated
+from tokenization import count_tokens, text_hash
+from vector_store import VectorStore
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+MAX_TOKENS = 8000  # the maximum for text-embedding-3-small is 8191
+COLUMNS = ["ProductId", "UserId", "Score", "Summary", "Text"]
+
+# Limits of one embeddings request.
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 250_000
+
+_DONE = object()
+
+
+def read_chunks(path: str, chunksize: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield the source CSV ``chunksize`` rows at a time, skipping already ingested rows."""
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
+    for chunk in pd.read_csv(path, index_col=0, chunksize=chunksize, skiprows=skiprows):
+        chunk.attrs["rows_read"] = len(chunk)
+        yield chunk
+
+
+def clean(df: pd.DataFrame, deleted_column: Optional[str] = None) -> pd.DataFrame:
+    """Keep the review columns; IDs of rows flagged as deleted go to ``attrs["deleted_ids"]``."""
+    rows_read = df.attrs["rows_read"]
+    deleted_ids = []
+    if deleted_column:
+        flagged = df[deleted_column].fillna(False).astype(bool)
+        deleted_ids = df.index[flagged].tolist()
+        df = df[~flagged]
+    df = df[COLUMNS].dropna()
+    df.attrs.update(rows_read=rows_read, deleted_ids=deleted_ids)
+    return df
+
+
+def combine(df: pd.DataFrame) -> pd.DataFrame:
+    df["combined"] = "Title: " + df.Summary.str.strip() + "; Content: " + df.Text.str.strip()
+    df["content_hash"] = [text_hash(text).hex() for text in df.combined]
+    return df
+
+
+def select_changed(df: pd.DataFrame, store: VectorStore) -> pd.DataFrame:
+    """Drop reviews whose text is already stored unchanged."""
+    attrs = dict(df.attrs)
+    changed = store.changed(df.index, df.content_hash)
+    df = df[changed]
+    df.attrs.update(attrs, unchanged=int((~changed).sum()))
+    return df
+
+
+def tokenize(df: pd.DataFrame, max_tokens: int = MAX_TOKENS) -> pd.DataFrame:
+    """Count tokens and split reviews longer than ``max_tokens`` into chunks."""
+    attrs = dict(df.attrs)
+    df = df.assign(id=df.index, chunk=0, n_tokens=count_tokens(df.combined.tolist(), DEFAULT_ENCODING).counts)
+    long_rows = df[df.n_tokens > max_tokens]
+    if len(long_rows):
+        pieces = []
+        for _, row in long_rows.iterrows():
+            for c in chunk_text(row.combined, max_tokens=max_tokens, overlap=max_tokens // 20):
+                pieces.append({**row.to_dict(), "combined": c.text, "chunk": c.chunk_index, "n_tokens": c.n_tokens})
+        df = pd.concat([df[df.n_tokens <= max_tokens], pd.DataFrame(pieces)], ignore_index=True)
+        df = df.sort_values(["id", "chunk"], kind="stable")
+    df = df.reset_index(drop=True)
+    df.attrs.update(attrs)
+    return df
+
+
+def token_batches(n_tokens: np.ndarray, max_inputs: int = MAX_BATCH_INPUTS, max_tokens: int = MAX_BATCH_TOKENS) -> List[slice]:
+    """Split rows into consecutive request batches bounded by input count and total tokens."""
+    batches, start, total = [], 0, 0
+    for i, n in enumerate(n_tokens):
+        if i > start and (i - start >= max_inputs or total + n > max_tokens):
+            batches.append(slice(start, i))
+            start, total = i, 0
+        total += n
+    if start < len(n_tokens):
+        batches.append(slice(start, len(n_tokens)))
+    return batches
+
+
+def make_embedder(client, model: str = EMBEDDING_MODEL, dimensions: Optional[int] = None) -> Callable[[List[str]], np.ndarray]:
+    """Return a function embedding a list of texts with one API call."""
+    kwargs = {"dimensions": dimensions} if dimensions else {}
+
+    def embed(texts: List[str]) -> np.ndarray:
+        # replace newlines, which can negatively affect performance.
+        texts = [text.replace("\n", " ") for text in texts]
+        data = client.embeddings.create(input=texts, model=model, **kwargs).data
+        return np.array([d.embedding for d in data], dtype=np.float32)
+
+    return embed
+
+
+def embed(
+    df: pd.DataFrame,
+    embed_batch: Callable[[List[str]], np.ndarray],
+    dedup_threshold: Optional[float] = DEFAULT_THRESHOLD,
+    duplicates: Optional[DuplicateIndex] = None,
+):
+    """Return ``(df, vectors)`` with one embedding per row.
+
+    Identical texts, and near-identical reviews of the same ``ProductId``
+    (see ``dedup.find_duplicates``), are embedded once; ``df["duplicate_of"]``
+    records the ID of the row whose vector was reused. With ``duplicates``
+    this also covers representatives of earlier batches. Pass
+    ``dedup_threshold=None`` to embed every row.
+    """
+    if df.empty:
+        return df, np.empty((0, 0), dtype=np.float32)
+    texts = df.combined.tolist()
+    n_tokens = dict(zip(texts, df.n_tokens.to_numpy()))
+    embedded = 0
+
+    def embed_texts(batch: List[str]) -> np.ndarray:
+        nonlocal embedded
+        embedded += len(batch)
+        sizes = np.array([n_tokens[text] for text in batch])
+        return np.concatenate([embed_batch(batch[s]) for s in token_batches(sizes)])
+
+    if dedup_threshold is None:
+        vectors, duplicate_of = embed_texts(texts), df.id.to_numpy()
+    else:
+        groups = df.ProductId.tolist() if "ProductId" in df else None
+        vectors, duplicate_of = embed_deduplicated(
+            texts, embed_texts, keys=df.id.to_numpy(), groups=groups, index=duplicates, threshold=dedup_threshold
+        )
+    df = df.assign(duplicate_of=duplicate_of)
+    df.attrs["embedded"] = embedded
+    return df, vectors
+
+
+def run_pipeline(source: Iterable, stages: List[Callable], maxsize: int = 2):
+    """Run ``source`` through ``stages``, one thread per stage, joined by bounded queues.
+
+    Yields the output of the last stage in order. The first exception raised
+    by any stage is re-raised in the caller.
+    """
+    queues = [queue.Queue(maxsize=maxsize) for _ in range(len(stages) + 1)]
+    errors = []
+    stop = threading.Event()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def feed():
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                put(queues[0], item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if hasattr(source, "close"):
+                source.close()  # release the reader even when a later stage failed
+            put(queues[0], _DONE)
+
+    def get(q):
+        # After a failure nobody may send _DONE, so waiting stages watch ``stop`` instead.
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def work(stage, inbox, outbox):
+        while True:
+            item = get(inbox)
+            if item is _DONE or stop.is_set():
+                put(outbox, _DONE)
+                return
+            try:
+                put(outbox, stage(item))
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                put(outbox, _DONE)
+                return
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    threads += [
+        threading.Thread(target=work, args=(stage, queues[i], queues[i + 1]), daemon=True)
+        for i, stage in enumerate(stages)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            try:
+                item = queues[-1].get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+        for q in queues:  # unblock anything still waiting on a full queue
+            while not q.empty():
+                q.get_nowait()
+    if errors:
+        raise errors[0]
+
+
+def ingest(
+    source_path: str,
+    store: VectorStore,
+    embed_batch: Callable[[List[str]], np.ndarray],
+    chunksize: int = 1000,
+    max_tokens: int = MAX_TOKENS,
+    deleted_column: Optional[str] = None,
+    refresh: bool = False,
+    dedup_threshold: Optional[float] = DEFAULT_THRESHOLD,
+    model: Optional[str] = None,
+):
+    """Ingest ``source_path`` into ``store``, resuming from the store's checkpoint.
+
+    With ``refresh`` the whole source is rescanned; unchanged reviews are
+    skipped before tokenizing and embedding. ``model`` names the model behind
+    ``embed_batch``; it must match the model the store serves.
+    """
+    source = os.path.abspath(source_path)
+    checkpoint = store.checkpoint
+    if checkpoint and checkpoint.get("source") != source and not refresh:
+        raise ValueError(f"store {store.path} was built from {checkpoint.get('source')}")
+    rows_done = 0 if refresh else checkpoint.get("rows_read", 0)
+    if rows_done:
+        print(f"Resuming after {rows_done} source rows")
+
+    # Representatives of earlier batches, so duplicates across batches are not embedded again either.
+    duplicates = DuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+    stages = [
+        lambda df: select_changed(combine(clean(df, deleted_column)), store),
+        lambda df: tokenize(df, max_tokens),
+        lambda df: embed(df, embed_batch, dedup_threshold, duplicates),
+    ]
+    started = time.perf_counter()
+    stored = embedded = unchanged = deleted = 0
+    for df, vectors in run_pipeline(read_chunks(source_path, chunksize, rows_done), stages):
+        rows_done += df.attrs["rows_read"]
+        deleted += store.upsert(
+            df, vectors, checkpoint={"source": source, "rows_read": rows_done}, model=model, delete=df.attrs["deleted_ids"]
+        )
+        stored += len(df)
+        embedded += df.attrs.get("embedded", 0)
+        unchanged += df.attrs["unchanged"]
+        elapsed = time.perf_counter() - started
+        print(
+            f"{rows_done} source rows done: {stored} rows stored ({stored / elapsed:.1f} rows/s), "
+            f"{embedded} embedded, {stored - embedded} deduplicated, {unchanged} unchanged, {deleted} deleted"
+        )
+    return rows_done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a review CSV into an embedding store.")
+    parser.add_argument("source", help="Review CSV, e.g. data/fine_food_reviews_1k.csv")
+    parser.add_argument("store", help="Directory of the embedding store (created if missing)")
+    parser.add_argument("--chunksize", type=int, default=1000, help="Source rows per pipeline batch")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="Split reviews longer than this")
+    parser.add_argument("--model", help=f"Embedding model (default: the store's model, else {EMBEDDING_MODEL})")
+    parser.add_argument("--dimensions", type=int, help="Ask the model for vectors of this size (text-embedding-3 models)")
+    parser.add_argument("--deleted-column", help="Boolean column marking rows to delete, e.g. IsDeleted")
+    parser.add_argument("--refresh", action="store_true", help="Rescan the whole source, embedding only new or changed rows")
+    parser.add_argument("--compact", action="store_true", help="Compact segments with many tombstones afterwards")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD, help="Jaccard similarity above which reviews of the same product share one embedding (1 = exact only)")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed every row, even duplicates")
+    args = parser.parse_args(argv)
+
+    dotenv.load_dotenv()
+    # The shared client factory lives next to embeddings_utils in lab-1.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lab-1"))
+    from openai_clients import get_client
+
+    store = VectorStore(args.store)
+    model = args.model or store.model or EMBEDDING_MODEL
+    if store.model and model != store.model:
+        parser.error(f"{args.store} holds {store.model} vectors; switch models with reembed.py")
+    client = get_client()
+    ingest(
+        args.source,
+        store,
+        make_embedder(client, model, args.dimensions),
+        args.chunksize,
+        args.max_tokens,
+        deleted_column=args.deleted_column,
+        refresh=args.refresh,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+        model=model,
+    )
+    if args.compact:
+        print(f"Compacted {store.compact()} segments")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Two-level product -> review index.
+
+Many review queries ("whole wheat pasta", "pet food") are really about
+products. This index groups review vectors by ``ProductId`` and keeps one
+centroid per product, plus optionally a few medoids (the reviews closest to
+the centroid) for products whose reviews are spread out. A query first scores
+the products, then scores only the reviews of the best ``n_products``, so
+per-query work shrinks by about the average number of reviews per product
+and product-level results come out directly.
+
+Usage:
+    index = ProductIndex.from_store(VectorStore("data/reviews_store"), n_medoids=2)
+    result = index.search(get_embedding("whole wheat pasta"), k=3, n_products=5)
+    result.products, result.rows
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from ann_index import normalize_rows, top_k
+
+
+class ProductSearchResult(NamedTuple):
+    products: np.ndarray  # product IDs, best first
+    product_scores: np.ndarray
+    rows: np.ndarray  # review row positions, best first
+    scores: np.ndarray  # cosine similarities of those reviews
+    rows_scored: int
+
+
+class ProductIndex:
+    """Product centroids (and medoids) over review vectors grouped by product."""
+
+    def __init__(self, vectors: np.ndarray, metadata: pd.DataFrame, product_column: str = "ProductId", n_medoids: int = 0):
+        self.vectors = normalize_rows(vectors)
+        self.vectors.flags.writeable = False
+        self.metadata = metadata.reset_index(drop=True)
+
+        codes, self.products = pd.factorize(self.metadata[product_column], sort=True)
+        self.products = np.asarray(self.products)
+        n_products = len(self.products)
+        # Reviews of product p are order[offsets[p]:offsets[p + 1]].
+        self.order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=n_products)
+        self.offsets = np.zeros(n_products + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+        sums = np.zeros((n_products, self.vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, codes, self.vectors)
+        self.centroids = normalize_rows(sums)
+
+        medoid_rows, medoid_owner = [], []
+        if n_medoids:
+            for p in np.flatnonzero(counts > 1):
+                rows = self.order[self.offsets[p] : self.offsets[p + 1]]
+                closest = top_k(self.vectors[rows] @ self.centroids[p], n_medoids)
+                medoid_rows.append(rows[closest])
+                medoid_owner.append(np.full(len(closest), p))
+        self.medoid_rows = np.concatenate(medoid_rows) if medoid_rows else np.empty(0, dtype=np.int64)
+        self.medoid_owner = np.concatenate(medoid_owner) if medoid_owner else np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "ProductIndex":
+        """Build from the live rows of a ``VectorStore``."""
+        metadata, vectors = store.load_live()
+        return cls(vectors, metadata, **kwargs)
+
+    @property
+    def reviews_per_product(self) -> float:
+        return len(self.vectors) / max(len(self.products), 1)
+
+    def product_scores(self, query: np.ndarray) -> np.ndarray:
+        """Score every product: best of its centroid and medoid similarities."""
+        scores = self.centroids @ query
+        if len(self.medoid_rows):
+            np.maximum.at(scores, self.medoid_owner, self.vectors[self.medoid_rows] @ query)
+        return scores
+
+    def search_products(self, query, n_products: int = 5):
+        """Return ``(product IDs, scores)`` of the best matching products."""
+        query = normalize_rows(np.asarray(query, dtype=np.float32))
+        scores = self.product_scores(query)
+        best = top_k(scores, n_products)
+        return self.products[best], scores[best]
+
+    def search(self, query, k: int = 3, n_products: int = 5) -> ProductSearchResult:
+        """Find the best products, then the best ``k`` reviews among them."""
+        query = normalize_rows(np.asarray(query, dtype=np.float32))
+        product_scores = self.product_scores(query)
+        best_products = top_k(product_scores, n_products)
+        rows = np.concatenate([self.order[self.offsets[p] : self.offsets[p + 1]] for p in best_products])
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return ProductSearchResult(
+            self.products[best_products],
+            product_scores[best_products],
+            rows[best],
+            scores[best],
+            len(self.products) + len(self.medoid_rows) + len(rows),
+        )
@@ -0,0 +1,231 @@
+"""
+Background re-embedding of an embedding store with a new model.
+
+Switching embedding models without search downtime:
+
+1. :meth:`VectorStore.begin_version` opens a pending version for the new
+   model next to the served one;
+2. :class:`Reembedder` reads the stored texts segment by segment, embeds the
+   records that the pending version lacks (or holds at an older content
+   hash) and adds them with :meth:`VectorStore.upsert_pending`, never using
+   more than ``tokens_per_minute`` of the embeddings quota so live traffic
+   keeps its headroom;
+3. records ingested or changed meanwhile (``ingest_reviews.py`` may keep
+   running in another process; the store serializes writers with a lock
+   file) show up in the next pass's backlog;
+   once a pass finds none, :meth:`VectorStore.cut_over` switches versions
+   with one manifest write.
+
+Searches read the served version until the cutover. Running search servers
+keep answering from the old segments until restarted, with query texts
+embedded by the old model, so queries and vectors always match.
+
+The job is resumable: the pending version is committed with every batch, so
+rerunning the same command continues where it stopped.
+
+Usage:
+    python reembed.py data/reviews_store --model text-embedding-3-large --tokens-per-minute 200000
+    python reembed.py data/reviews_store --model text-embedding-3-large --dimensions 1024
+    python reembed.py data/reviews_store --status
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Iterator, List, Optional
+
+import dotenv
+import numpy as np
+import pandas as pd
+
+from chunking import DEFAULT_ENCODING
+from dedup import DEFAULT_THRESHOLD, DuplicateIndex
+from ingest_reviews import embed, make_embedder
+from tokenization import count_tokens
+from vector_store import VectorStore
+
+
+class Reembedder:
+    """Throttled job that fills a store's pending version and cuts over when it is complete."""
+
+    def __init__(
+        self,
+        store: VectorStore,
+        embed_batch: Callable[[List[str]], np.ndarray],
+        model: str,
+        dims: Optional[int] = None,
+        text_column: str = "combined",
+        batch_rows: int = 256,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+    ):
+        self.store = store
+        self.embed_batch = embed_batch
+        self.text_column = text_column
+        self.batch_rows = batch_rows
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.stats = Counter()
+        self.error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ready_at = time.monotonic()
+        self._duplicates = DuplicateIndex(DEFAULT_THRESHOLD)  # vectors of the new model, shared across batches
+        store.begin_version(model, dims)
+
+    def batches(self, backlog: dict) -> Iterator[pd.DataFrame]:
+        """Yield the stored rows of backlog records, whole records per batch, segment by segment."""
+        for seg in self.store.iter_segments():
+            ids = seg.metadata["id"].astype(str)
+            wanted = seg.live & ids.isin(backlog.keys()).to_numpy()
+            # Keep the hashes exactly as the store's index has them (CSV parsing may not).
+            rows = seg.metadata[wanted].assign(content_hash=ids[wanted].map(backlog))
+            batch, size = [], 0
+            for _, record in rows.groupby(ids[wanted], sort=False):
+                if batch and size + len(record) > self.batch_rows:
+                    yield pd.concat(batch, ignore_index=True)
+                    batch, size = [], 0
+                batch.append(record)
+                size += len(record)
+            if batch:
+                yield pd.concat(batch, ignore_index=True)
+
+    def _throttle(self, tokens: int):
+        """Wait until ``tokens`` more fit in the tokens-per-minute budget."""
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        start = max(now, self._ready_at)
+        self._ready_at = start + tokens * 60.0 / self.tokens_per_minute
+        self._stop.wait(start - now)
+
+    def _embed(self, df: pd.DataFrame):
+        if "n_tokens" not in df:
+            df = df.assign(n_tokens=count_tokens(df[self.text_column].tolist(), DEFAULT_ENCODING).counts)
+        if self.text_column != "combined":
+            df = df.assign(combined=df[self.text_column])
+        self._throttle(int(df.n_tokens.sum()))
+        for attempt in range(self.max_retries + 1):
+            try:
+                return embed(df, self.embed_batch, DEFAULT_THRESHOLD, self._duplicates)
+            except Exception:
+                if attempt == self.max_retries or self._stop.is_set():
+                    raise
+                self.stats["retries"] += 1
+                self._stop.wait(min(60.0, 2.0**attempt))
+
+    def run_pass(self) -> int:
+        """Re-embed the current backlog once; returns the number of rows added."""
+        added = 0
+        for df in self.batches(self.store.pending_backlog()):
+            if self._stop.is_set():
+                break
+            df, vectors = self._embed(df)
+            if self.text_column != "combined":
+                df = df.drop(columns="combined")
+            self.store.upsert_pending(df, vectors)
+            added += len(df)
+            self.stats["rows"] += len(df)
+            self.stats["tokens"] += int(df.n_tokens.sum())
+        return added
+
+    def run(self, poll_interval: float = 5.0) -> bool:
+        """Pass over the backlog until it is empty, then cut over; returns False if stopped first."""
+        while not self._stop.is_set():
+            self.stats["passes"] += 1
+            added = self.run_pass()
+            if self._stop.is_set():
+                break
+            if not added and self.store.cut_over():
+                return True
+            if not added:
+                # Only records edited during the pass are left; give the writer a moment.
+                self._stop.wait(poll_interval)
+        return False
+
+    def start(self, poll_interval: float = 5.0) -> "Reembedder":
+        """Run the job on a daemon thread; errors end up in :attr:`error`."""
+
+        def target():
+            try:
+                self.run(poll_interval)
+            except BaseException as e:
+                self.error = e
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=target, name="reembedder", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def status(store: VectorStore) -> str:
+    if store.pending is None:
+        return f"Serving {len(store)} rows of {store.model} ({store.dims} dims), no migration pending"
+    return (
+        f"Serving {store.model} ({store.dims} dims); migrating to {store.pending['model']}: "
+        f"{len(store.pending_backlog())} records left to re-embed"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed an embedding store with a new model, then cut over.")
+    parser.add_argument("store", help="Directory of the embedding store")
+    parser.add_argument("--model", help="Embedding model of the new version")
+    parser.add_argument("--dimensions", type=int, help="Ask the model for vectors of this size (text-embedding-3 models)")
+    parser.add_argument("--tokens-per-minute", type=float, help="Embeddings quota the job may use")
+    parser.add_argument("--batch-rows", type=int, default=256, help="Rows per embeddings call")
+    parser.add_argument("--text-column", default="combined", help="Stored metadata column holding the embedded text")
+    parser.add_argument("--status", action="store_true", help="Only report migration progress")
+    parser.add_argument("--abort", action="store_true", help="Drop the pending version")
+    args = parser.parse_args(argv)
+
+    store = VectorStore(args.store)
+    if args.abort:
+        store.abort_version()
+    if args.status or args.abort:
+        return print(status(store))
+    if not args.model:
+        parser.error("--model is required")
+
+    dotenv.load_dotenv()
+    # The shared client factory lives next to embeddings_utils in lab-1.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lab-1"))
+    from openai_clients import get_client
+
+    job = Reembedder(
+        store,
+        make_embedder(get_client(), args.model, args.dimensions),
+        args.model,
+        args.dimensions,
+        args.text_column,
+        args.batch_rows,
+        args.tokens_per_minute,
+    ).start()
+    try:
+        while job.running:
+            job.join(10.0)
+            print(f"{status(store)} ({job.stats['rows']} rows, {job.stats['tokens']} tokens this run)")
+    except KeyboardInterrupt:
+        job.stop()
+    if job.error is not None:
+        raise job.error
+    print(status(store))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+Retrieval-quality evaluation for the review search backends.
+
+Given a labeled query set (query vectors, optional query texts and graded
+relevant rows), every backend returns its top-k rows for all queries and
+the metrics are computed as array operations over the ``queries x k``
+ranking matrix:
+
+    recall@k   fraction of a query's relevant rows found in the top k
+    MRR        1 / rank of the first relevant row (0 if none in the top k)
+    nDCG@k     graded gain discounted by log2(rank + 1), over the ideal order
+
+``precision_recall_curve`` scores the full ``queries x corpus`` matrix in
+chunks (bounded by ``max_elements``), histograms the scores of relevant
+and non-relevant pairs and turns the cumulative counts into a micro-averaged
+precision/recall curve.
+
+Backends compared side by side:
+
+    exact        brute-force cosine (the reference)
+    ivf          ``ann_index.IVFIndex`` with ``nprobe`` lists
+    int8         per-row scalar-quantized vectors (4x smaller), optionally
+                 re-ranking the best ``rerank * k`` candidates exactly
+    bm25         keyword search over the review text
+    hybrid       reciprocal rank fusion of exact vector and BM25 rankings
+
+Without a labeled set, the CLI builds one from the store: sampled reviews
+are queries (their stored vector and Summary), and the other reviews of the
+same product are relevant.
+
+Usage:
+    python retrieval_eval.py data/reviews_store --queries 2000 -k 10
+    python retrieval_eval.py data/reviews_store --qrels queries.jsonl   # {"query": ..., "relevant": [ids], "grades": [...]}
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ann_index import IVFIndex, normalize_rows, top_k
+from vector_store import VectorStore
+
+# Largest queries x rows score block held in memory at once (float32: 256 MB).
+MAX_ELEMENTS = 1 << 26
+RRF_K = 60
+EMBED_BATCH_SIZE = 2048  # most inputs per embeddings request
+
+_WORD = re.compile(r"\w+")
+
+
+class QuerySet(NamedTuple):
+    vectors: np.ndarray  # (n_queries, dims)
+    texts: Optional[List[str]]  # needed by bm25 and hybrid
+    qrels: np.ndarray  # (n_pairs, 3) of query index, corpus row, grade > 0
+    exclude: Optional[np.ndarray] = None  # per-query row never counted (e.g. the query itself)
+
+
+# A backend maps (query vectors, query texts, k) to (ids, scores), both (n_queries, k), ids -1 padded.
+Backend = Callable[[np.ndarray, Optional[List[str]], int], tuple]
+
+
+def _top_k_rows(scores: np.ndarray, k: int):
+    """Per row of ``scores``, the ``k`` best column indices and scores, best first."""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, 1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, 1), np.take_along_axis(part_scores, order, 1)
+
+
+def _query_chunks(n_queries: int, n_rows: int, max_elements: int = MAX_ELEMENTS):
+    step = max(1, max_elements // max(n_rows, 1))
+    for start in range(0, n_queries, step):
+        yield slice(start, min(start + step, n_queries))
+
+
+def _rank_in_group(groups: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Position of each element within its group, for ``groups`` sorted ascending."""
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return np.arange(len(groups)) - np.repeat(starts, counts)
+
+
+class ExactBackend:
+    """Brute-force cosine similarity, chunked over queries."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = normalize_rows(vectors)
+
+    def __call__(self, queries: np.ndarray, texts=None, k: int = 10):
+        queries = normalize_rows(queries)
+        ids = np.empty((len(queries), min(k, len(self.vectors))), dtype=np.int64)
+        scores = np.empty(ids.shape, dtype=np.float32)
+        for rows in _query_chunks(len(queries), len(self.vectors)):
+            ids[rows], scores[rows] = _top_k_rows(queries[rows] @ self.vectors.T, k)
+        return ids, scores
+
+
+class IVFBackend:
+    """``IVFIndex`` search, one query at a time (as it is served)."""
+
+    def __init__(self, index: IVFIndex, nprobe: int = 8):
+        self.index = index
+        self.nprobe = nprobe
+
+    def __call__(self, queries: np.ndarray, texts=None, k: int = 10):
+        queries = normalize_rows(queries)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            rows, row_scores, _ = self.index.search(query, k, self.nprobe)
+            ids[i, : len(rows)], scores[i, : len(rows)] = rows, row_scores
+        return ids, scores
+
+
+class Int8Backend:
+    """Scalar-quantized vectors: int8 codes with one float scale per row.
+
+    With ``rerank``, the best ``rerank * k`` candidates by quantized score are
+    re-scored against the full-precision vectors.
+    """
+
+    def __init__(self, vectors: np.ndarray, rerank: int = 0, block_rows: int = 65_536):
+        vectors = normalize_rows(vectors)
+        self.scale = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        self.codes = np.round(vectors / self.scale[:, None]).astype(np.int8)
+        self.scale = self.scale.astype(np.float32)
+        self.rerank = rerank
+        self.full = vectors if rerank else None
+        self.block_rows = block_rows
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            block = self.codes[start : start + self.block_rows].astype(np.float32)
+            scores[:, start : start + len(block)] = (queries @ block.T) * self.scale[start : start + len(block)]
+        return scores
+
+    def __call__(self, queries: np.ndarray, texts=None, k: int = 10):
+        queries = normalize_rows(queries)
+        depth = k * self.rerank if self.rerank else k
+        ids = np.empty((len(queries), min(k, len(self.codes))), dtype=np.int64)
+        scores = np.empty(ids.shape, dtype=np.float32)
+        for rows in _query_chunks(len(queries), len(self.codes)):
+            candidates, candidate_scores = _top_k_rows(self._scores(queries[rows]), depth)
+            if self.rerank:
+                # Exact scores of the candidates only: (q, depth, dims) x (q, dims), 256 queries at a time.
+                for start in range(0, len(candidates), 256):
+                    part = slice(start, start + 256)
+                    candidate_scores[part] = np.einsum(
+                        "qcd,qd->qc", self.full[candidates[part]], queries[rows][part]
+                    )
+            best, scores[rows] = _top_k_rows(candidate_scores, k)
+            ids[rows] = np.take_along_axis(candidates, best, 1)
+        return ids, scores
+
+
+class BM25Backend:
+    """Okapi BM25 over tokenized texts, with postings in CSR arrays."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = [self.vocabulary.setdefault(t, len(self.vocabulary)) for t in _WORD.findall(str(text).lower())]
+            lengths[doc] = len(tokens)
+            terms, counts = np.unique(np.asarray(tokens, dtype=np.int64), return_counts=True)
+            term_ids.append(terms)
+            doc_ids.append(np.full(len(terms), doc, dtype=np.int64))
+            tfs.append(counts)
+        term_ids, doc_ids, tfs = (np.concatenate(a) if a else np.empty(0, np.int64) for a in (term_ids, doc_ids, tfs))
+
+        # Postings of term t are doc_ids[ptr[t]:ptr[t + 1]], with precomputed BM25 weights.
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = doc_ids[order]
+        self.ptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=self.ptr[1:])
+        n_docs = len(texts)
+        df = np.diff(self.ptr)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        tf = tfs[order].astype(np.float32)
+        norm = k1 * (1 - b + b * lengths[self.doc_ids] / max(lengths.mean(), 1e-12))
+        self.weights = (idf[term_ids[order]] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        self.n_docs = n_docs
+
+    def scores(self, text: str) -> np.ndarray:
+        terms = [self.vocabulary[t] for t in _WORD.findall(text.lower()) if t in self.vocabulary]
+        if not terms:
+            return np.zeros(self.n_docs, dtype=np.float32)
+        postings = np.concatenate([np.arange(self.ptr[t], self.ptr[t + 1]) for t in terms])
+        return np.bincount(self.doc_ids[postings], weights=self.weights[postings], minlength=self.n_docs).astype(np.float32)
+
+    def __call__(self, queries, texts: List[str], k: int = 10):
+        if texts is None:
+            raise ValueError("bm25 needs query texts")
+        ids = np.empty((len(texts), min(k, self.n_docs)), dtype=np.int64)
+        scores = np.empty(ids.shape, dtype=np.float32)
+        for i, text in enumerate(texts):
+            text_scores = self.scores(text)
+            ids[i] = top_k(text_scores, k)
+            scores[i] = text_scores[ids[i]]
+        return ids, scores
+
+
+class HybridBackend:
+    """Reciprocal rank fusion of two backends' top-``depth`` rankings."""
+
+    def __init__(self, first: Backend, second: Backend, depth: int = 100, rrf_k: int = RRF_K):
+        self.first, self.second = first, second
+        self.depth = depth
+        self.rrf_k = rrf_k
+
+    def __call__(self, queries: np.ndarray, texts: Optional[List[str]], k: int = 10):
+        n_queries = len(queries)
+        parts = []
+        for backend in (self.first, self.second):
+            ids, _ = backend(queries, texts, self.depth)
+            ranks = np.broadcast_to(np.arange(ids.shape[1]), ids.shape)
+            query = np.broadcast_to(np.arange(n_queries)[:, None], ids.shape)
+            valid = ids >= 0
+            parts.append((query[valid], ids[valid], 1.0 / (self.rrf_k + 1 + ranks[valid])))
+        query, rows, weight = (np.concatenate(p) for p in zip(*parts))
+
+        # Sum the fused score of each (query, row) pair, then keep the top k per query.
+        n_rows = int(rows.max()) + 1 if len(rows) else 1
+        pairs, inverse = np.unique(query * n_rows + rows, return_inverse=True)
+        fused = np.bincount(inverse, weights=weight)
+        pair_query, pair_row = pairs // n_rows, pairs % n_rows
+        order = np.lexsort((-fused, pair_query))
+        counts = np.bincount(pair_query, minlength=n_queries)
+        rank = _rank_in_group(pair_query[order], counts)
+        keep = order[rank < k]
+        ids = np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.zeros((n_queries, k), dtype=np.float32)
+        ids[pair_query[keep], rank[rank < k]] = pair_row[keep]
+        scores[pair_query[keep], rank[rank < k]] = fused[keep]
+        return ids, scores
+
+
+def grades_of(ranked: np.ndarray, qrels: np.ndarray, n_rows: int) -> np.ndarray:
+    """Relevance grade of each ranked row (0 for non-relevant and padding)."""
+    keys = qrels[:, 0].astype(np.int64) * n_rows + qrels[:, 1].astype(np.int64)
+    order = np.argsort(keys)
+    keys, grades = keys[order], qrels[order, 2].astype(np.float64)
+    lookup = np.arange(len(ranked))[:, None] * n_rows + np.maximum(ranked, 0)
+    pos = np.minimum(np.searchsorted(keys, lookup), max(len(keys) - 1, 0))
+    found = (ranked >= 0) & (keys[pos] == lookup) if len(keys) else np.zeros(ranked.shape, dtype=bool)
+    return np.where(found, grades[pos] if len(keys) else 0.0, 0.0)
+
+
+def ideal_grades(qrels: np.ndarray, n_queries: int, k: int) -> np.ndarray:
+    """Per query, the ``k`` highest relevance grades in descending order (zero padded)."""
+    query, grade = qrels[:, 0].astype(np.int64), qrels[:, 2].astype(np.float64)
+    order = np.lexsort((-grade, query))
+    rank = _rank_in_group(query[order], np.bincount(query, minlength=n_queries))
+    keep = rank < k
+    ideal = np.zeros((n_queries, k))
+    ideal[query[order][keep], rank[keep]] = grade[order][keep]
+    return ideal
+
+
+def recall_at_k(grades: np.ndarray, n_relevant: np.ndarray, k: int) -> np.ndarray:
+    return (grades[:, :k] > 0).sum(axis=1) / np.maximum(n_relevant, 1)
+
+
+def reciprocal_rank(grades: np.ndarray) -> np.ndarray:
+    hit = grades > 0
+    return np.where(hit.any(axis=1), 1.0 / (hit.argmax(axis=1) + 1), 0.0)
+
+
+def ndcg_at_k(grades: np.ndarray, ideal: np.ndarray, k: int) -> np.ndarray:
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (grades[:, :k] * discount[: grades[:, :k].shape[1]]).sum(axis=1)
+    idcg = (ideal[:, :k] * discount).sum(axis=1)
+    return np.where(idcg > 0, dcg / np.maximum(idcg, 1e-12), 0.0)
+
+
+def _drop_excluded(ids: np.ndarray, scores: np.ndarray, exclude: Optional[np.ndarray], k: int):
+    """Remove each query's excluded row and cut the rankings to ``k``."""
+    if exclude is not None:
+        drop = ids == exclude[:, None]
+        order = np.argsort(drop, axis=1, kind="stable")  # excluded entries move to the end
+        ids, scores = np.take_along_axis(ids, order, 1), np.take_along_axis(scores, order, 1)
+        ids = np.where(np.take_along_axis(drop, order, 1), -1, ids)
+    return ids[:, :k], scores[:, :k]
+
+
+def evaluate(backends: Dict[str, Backend], query_set: QuerySet, n_rows: int, k: int = 10, ks: Sequence[int] = (1, 5)) -> pd.DataFrame:
+    """Run every backend on the query set and tabulate quality and speed."""
+    n_queries = len(query_set.vectors)
+    n_relevant = np.bincount(query_set.qrels[:, 0].astype(np.int64), minlength=n_queries)
+    ideal = ideal_grades(query_set.qrels, n_queries, k)
+    depth = k + (query_set.exclude is not None)
+
+    rows = []
+    for name, backend in backends.items():
+        start = time.perf_counter()
+        ids, scores = backend(query_set.vectors, query_set.texts, depth)
+        elapsed = time.perf_counter() - start
+        ids, _ = _drop_excluded(ids, scores, query_set.exclude, k)
+        grades = grades_of(ids, query_set.qrels, n_rows)
+        row = {"backend": name}
+        for cutoff in sorted(set(ks) | {k}):
+            row[f"recall@{cutoff}"] = recall_at_k(grades, n_relevant, cutoff).mean()
+        row[f"mrr@{k}"] = reciprocal_rank(grades).mean()
+        row[f"ndcg@{k}"] = ndcg_at_k(grades, ideal, k).mean()
+        row["queries/sec"] = n_queries / elapsed if elapsed else float("inf")
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("backend")
+
+
+def precision_recall_curve(
+    query_set: QuerySet, vectors: np.ndarray, n_bins: int = 1000, max_elements: int = MAX_ELEMENTS
+):
+    """Micro-averaged precision/recall over cosine thresholds, from the full score matrix.
+
+    Returns ``(precision, recall, thresholds)`` with thresholds descending.
+    """
+    vectors = normalize_rows(vectors)
+    queries = normalize_rows(query_set.vectors)
+    n_rows = len(vectors)
+    qrels = query_set.qrels
+    all_counts = np.zeros(n_bins, dtype=np.int64)
+    relevant_counts = np.zeros(n_bins, dtype=np.int64)
+    for rows in _query_chunks(len(queries), n_rows, max_elements):
+        scores = queries[rows] @ vectors.T
+        bins = np.clip(((scores + 1) / 2 * n_bins).astype(np.int64), 0, n_bins - 1)
+        valid = np.ones(scores.shape, dtype=bool)
+        if query_set.exclude is not None:
+            valid[np.arange(scores.shape[0]), query_set.exclude[rows]] = False
+        relevant = np.zeros(scores.shape, dtype=bool)
+        in_chunk = (qrels[:, 0] >= rows.start) & (qrels[:, 0] < rows.stop)
+        relevant[qrels[in_chunk, 0].astype(np.int64) - rows.start, qrels[in_chunk, 1].astype(np.int64)] = True
+        all_counts += np.bincount(bins[valid], minlength=n_bins)
+        relevant_counts += np.bincount(bins[valid & relevant], minlength=n_bins)
+
+    # Sweep the threshold from the highest bin down.
+    true_positives = np.cumsum(relevant_counts[::-1])
+    predicted = np.cumsum(all_counts[::-1])
+    precision = true_positives / np.maximum(predicted, 1)
+    recall = true_positives / max(int(relevant_counts.sum()), 1)
+    thresholds = (np.arange(n_bins, 0, -1) - 1) / n_bins * 2 - 1
+    return precision, recall, thresholds
+
+
+def average_precision(precision: np.ndarray, recall: np.ndarray) -> float:
+    return float(np.sum(np.diff(np.concatenate([[0.0], recall])) * precision))
+
+
+def product_query_set(metadata: pd.DataFrame, vectors: np.ndarray, n_queries: int, seed: int = 0) -> QuerySet:
+    """Reviews as queries; the other reviews of the same product are relevant (grade 1)."""
+    codes, _ = pd.factorize(metadata["ProductId"])
+    counts = np.bincount(codes)
+    candidates = np.flatnonzero(counts[codes] > 1)
+    rng = np.random.default_rng(seed)
+    queries = np.sort(rng.choice(candidates, min(n_queries, len(candidates)), replace=False))
+
+    # Rows of product p are order[offsets[p]:offsets[p + 1]].
+    order = np.argsort(codes, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    sizes = counts[codes[queries]]
+    query_index = np.repeat(np.arange(len(queries)), sizes)
+    starts = np.repeat(offsets[codes[queries]], sizes)
+    relevant_rows = order[starts + _rank_in_group(query_index, sizes)]
+    keep = relevant_rows != queries[query_index]
+    qrels = np.stack([query_index[keep], relevant_rows[keep], np.ones(keep.sum(), dtype=np.int64)], axis=1)
+
+    text_column = "Summary" if "Summary" in metadata else "combined"
+    texts = metadata[text_column].astype(str).to_numpy()[queries].tolist()
+    return QuerySet(vectors[queries], texts, qrels, exclude=queries)
+
+
+def load_query_set(
+    path: str,
+    metadata: pd.DataFrame,
+    embed: Callable[[List[str]], List[List[float]]],
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> QuerySet:
+    """Read JSON lines of ``{"query": text, "relevant": [store ids], "grades": [...]}``.
+
+    Every row of a relevant record (all chunks of a long review) counts as relevant.
+    Query texts are embedded ``batch_size`` at a time.
+    """
+    rows_of = metadata.groupby(metadata["id"].astype(str)).indices
+    texts, pairs = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            grades = item.get("grades") or [1] * len(item["relevant"])
+            for record, grade in zip(item["relevant"], grades):
+                for row in rows_of.get(str(record), ()):
+                    pairs.append((len(texts), row, grade))
+            texts.append(item["query"])
+    vectors = np.asarray(
+        [vector for start in range(0, len(texts), batch_size) for vector in embed(texts[start : start + batch_size])],
+        dtype=np.float32,
+    )
+    return QuerySet(vectors, texts, np.asarray(pairs, dtype=np.int64).reshape(-1, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare retrieval quality and speed of the search backends.")
+    parser.add_argument("store", help="Directory of the embedding store")
+    parser.add_argument("--qrels", help="JSON lines of labeled queries (default: same-product reviews as relevant)")
+    parser.add_argument("--queries", type=int, default=1000, help="Sampled queries when no --qrels is given")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--rerank", type=int, default=4, help="Re-rank rerank*k int8 candidates exactly (0 = off)")
+    parser.add_argument("--text-column", default="combined", help="Metadata column indexed by BM25")
+    args = parser.parse_args(argv)
+
+    store = VectorStore(args.store)
+    metadata, vectors = store.load_live()
+    if args.qrels:
+        import dotenv
+
+        dotenv.load_dotenv()
+        # The embedding helpers live in lab-1.
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lab-1"))
+        from embeddings_utils import DEFAULT_MODEL, get_embeddings
+
+        # Embed queries with the model the store serves, which may differ from the env default after a cutover.
+        model = store.model or DEFAULT_MODEL
+        query_set = load_query_set(args.qrels, metadata, lambda texts: get_embeddings(texts, model=model))
+    else:
+        query_set = product_query_set(metadata, vectors, args.queries)
+
+    exact = ExactBackend(vectors)
+    backends: Dict[str, Backend] = {
+        "exact": exact,
+        "ivf": IVFBackend(IVFIndex(exact.vectors), args.nprobe),
+        "int8": Int8Backend(vectors),
+    }
+    if args.rerank:
+        backends[f"int8+rerank{args.rerank}"] = Int8Backend(vectors, rerank=args.rerank)
+    if args.text_column in metadata:
+        bm25 = BM25Backend(metadata[args.text_column].astype(str).tolist())
+        backends["bm25"] = bm25
+        backends["hybrid"] = HybridBackend(exact, bm25)
+
+    print(f"{len(query_set.vectors)} queries, {len(query_set.qrels)} relevant pairs, {len(vectors)} rows")
+    with pd.option_context("display.float_format", "{:.3f}".format, "display.width", 120):
+        print(evaluate(backends, query_set, len(vectors), args.k))
+    precision, recall, _ = precision_recall_curve(query_set, vectors)
+    print(f"exact average precision over all pairs: {average_precision(precision, recall):.3f}")
+
+
+if __name__ == "__main__":
+    main()
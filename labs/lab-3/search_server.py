@@ -0,0 +1,423 @@
+"""
+Multi-core sharded search server for the review corpus.
+
+The rows of an embedding store are split into contiguous shards, one per
+worker process. Workers memory-map the store's segment ``.npy`` files, so
+every process reads the same pages from the OS page cache and the vectors
+are never copied into the parent or pickled. Each shard scores whole
+batches of queries with one matrix product per block of rows, keeps its own
+top-k per query and sends back only ``(row IDs, scores)``. The parent
+merges the per-shard top-k.
+
+Concurrent requests are micro-batched: a dispatcher thread collects queued
+queries for up to ``max_wait_ms`` (or ``max_batch`` queries), scatters the
+batch to all shards at once and resolves each request's future, so
+throughput grows with the number of cores instead of being bound by one
+process.
+
+HTTP/JSON API:
+
+    POST /search  {"vector": [...], "k": 3, "columns": ["combined"]}
+                  or {"vectors": [[...], ...], ...}
+                  or {"text": "bad delivery", ...} / {"texts": [...], ...} with --embed
+               -> {"results": [{"rows": [...], "scores": [...], "columns": {...}}]}
+                  k must be between 1 and MAX_K (1000), and vectors must have the
+                  store's dimensions; other requests get 400
+    GET  /stats   shards, rows, batches and queries served
+
+Usage:
+    python search_server.py data/reviews_store --shards 4 --port 8020
+    python search_server.py data/reviews_store --shards 4 --bench 5000
+    python search_server.py data/reviews_store --embed --embed-wait-ms 10
+
+With ``--embed``, query texts from concurrent requests are embedded through
+lab-1's ``EmbeddingBatcher``, so they share batched embeddings calls too.
+
+The server answers from the store as it was at startup; restart it to pick
+up new ingests or a new embedding model after ``reembed.py`` cut over.
+Query texts are embedded with the store's model unless ``--embed-model``
+says otherwise.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, NamedTuple, Optional, Sequence
+
+import dotenv
+import numpy as np
+import pandas as pd
+
+from ann_index import normalize_rows
+from search_service import SearchHits
+from vector_store import VectorStore
+
+BLOCK_ROWS = 65_536  # rows scored per matrix product inside a shard
+MAX_K = 1000  # most hits one query may ask for
+
+# Each worker owns one core; keep BLAS single-threaded so shards do not oversubscribe.
+_WORKER_ENV = {"OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+
+
+class ShardPart(NamedTuple):
+    path: str  # segment .npy file
+    start: int
+    stop: int
+    ids: np.ndarray  # corpus row ID of each row in [start, stop), -1 for tombstones
+
+
+def plan_shards(store: VectorStore, n_shards: int):
+    """Split the store's rows into ``n_shards`` contiguous ranges.
+
+    Returns ``(metadata of live rows, list of shards)``, where each shard is
+    a list of :class:`ShardPart`. Shards are balanced by stored rows
+    (tombstoned rows are scanned too, so they count toward the work).
+    """
+    frames, segments, n_live = [], [], 0
+    for seg in store.iter_segments():
+        ids = np.full(len(seg.live), -1, dtype=np.int64)
+        ids[seg.live] = np.arange(n_live, n_live + int(seg.live.sum()))
+        n_live += int(seg.live.sum())
+        frames.append(seg.metadata[seg.live])
+        segments.append((store._file(seg.name, ".npy"), ids))
+    metadata = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    total = sum(len(ids) for _, ids in segments)
+    bounds = np.linspace(0, total, n_shards + 1).astype(np.int64)
+    shards = [[] for _ in range(n_shards)]
+    offset = 0
+    for path, ids in segments:
+        for shard in range(n_shards):
+            start = max(bounds[shard], offset) - offset
+            stop = min(bounds[shard + 1], offset + len(ids)) - offset
+            if start < stop:
+                shards[shard].append(ShardPart(path, int(start), int(stop), ids[start:stop]))
+        offset += len(ids)
+    return metadata, [shard for shard in shards if shard]
+
+
+def _merge_top_k(ids: np.ndarray, scores: np.ndarray, k: int):
+    """Per row of ``scores`` (queries x candidates), keep the best ``k``, best first."""
+    k = min(k, scores.shape[1])
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids, scores = np.take_along_axis(ids, part, 1), np.take_along_axis(scores, part, 1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ids, order, 1), np.take_along_axis(scores, order, 1)
+
+
+def _shard_worker(conn, parts: List[ShardPart]):
+    """Serve ``(queries, k)`` requests for one shard until a ``None`` arrives."""
+    blocks = []
+    for part in parts:
+        vectors = np.load(part.path, mmap_mode="r")
+        for start in range(part.start, part.stop, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, part.stop)
+            block = vectors[start:stop]
+            ids = part.ids[start - part.start : stop - part.start]
+            # Scale scores instead of the vectors, so rows stay memory-mapped.
+            inv_norm = 1.0 / np.maximum(np.linalg.norm(block, axis=1), 1e-12).astype(np.float32)
+            blocks.append((block, ids, inv_norm, np.flatnonzero(ids < 0)))
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        queries, k = request
+        try:
+            best_ids = np.empty((len(queries), 0), dtype=np.int64)
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            for block, ids, inv_norm, dead in blocks:
+                scores = (queries @ block.T) * inv_norm
+                scores[:, dead] = -np.inf  # tombstones never win
+                if scores.shape[1] > k:
+                    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    scores = np.take_along_axis(scores, part, 1)
+                else:
+                    part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                best_ids = np.concatenate([best_ids, ids[part]], axis=1)
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_ids, best_scores = _merge_top_k(best_ids, best_scores, k)
+        except Exception as e:
+            # Report the failure and keep serving; the parent raises it for this batch.
+            conn.send(RuntimeError(f"shard worker failed: {e!r}"))
+            continue
+        conn.send((best_ids, best_scores))
+    conn.close()
+
+
+def _check_k(k: int):
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}, got {k}")
+
+
+class ShardedSearch:
+    """Scatter/gather top-k search over worker processes, with request batching."""
+
+    def __init__(self, store: VectorStore, n_shards: Optional[int] = None, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.metadata, self.shards = plan_shards(store, n_shards or os.cpu_count() or 1)
+        self.dims = store.dims
+        self.columns = {column: self.metadata[column].to_numpy() for column in self.metadata.columns}
+        self.n_rows = len(self.metadata)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = Counter()
+        self._lock = threading.Lock()  # one scatter/gather at a time on the pipes
+        self._pending: "queue.Queue" = queue.Queue()
+        self._conns, self._processes = [], []
+        self._dispatcher = None
+
+    def start(self) -> "ShardedSearch":
+        ctx = multiprocessing.get_context("spawn")
+        saved = {name: os.environ.get(name) for name in _WORKER_ENV}
+        os.environ.update(_WORKER_ENV)
+        try:
+            for parts in self.shards:
+                parent_conn, child_conn = ctx.Pipe()
+                process = ctx.Process(target=_shard_worker, args=(child_conn, parts), daemon=True)
+                process.start()
+                child_conn.close()
+                self._conns.append(parent_conn)
+                self._processes.append(process)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._pending.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns, self._processes = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search_batch(self, queries, k: int = 3):
+        """Top-``k`` ``(row IDs, scores)`` arrays for a batch of queries, across all shards."""
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if not self._conns:  # nothing stored
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        with self._lock:
+            for conn in self._conns:
+                conn.send((queries, k))
+            replies = [conn.recv() for conn in self._conns]
+            self.stats["batches"] += 1
+            self.stats["queries"] += len(queries)
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        ids = np.concatenate([r[0] for r in replies], axis=1)
+        scores = np.concatenate([r[1] for r in replies], axis=1)
+        return _merge_top_k(ids, scores, k)
+
+    def check_query(self, query, k: int) -> np.ndarray:
+        """Return ``query`` as a float32 vector; ValueError unless it fits the store and 1 <= k <= MAX_K."""
+        _check_k(k)
+        query = np.asarray(query, dtype=np.float32)
+        if query.shape != (self.dims,):
+            raise ValueError(f"expected a {self.dims}-dimensional vector, got shape {query.shape}")
+        return query
+
+    def submit(self, query, k: int = 3) -> Future:
+        """Queue one query for the next micro-batch; the future yields ``(row IDs, scores)``."""
+        future = Future()
+        self._pending.put((self.check_query(query, k), k, future))
+        return future
+
+    def search(self, query, k: int = 3, columns: Optional[Sequence[str]] = None) -> SearchHits:
+        ids, scores = self.submit(query, k).result()
+        return SearchHits(ids, scores, {c: self.columns[c][ids] for c in columns or ()})
+
+    def _dispatch(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._pending.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+
+            k = max(k for _, k, _ in batch)
+            try:
+                ids, scores = self.search_batch(np.stack([q for q, _, _ in batch]), k)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for i, (_, k_i, future) in enumerate(batch):
+                keep = scores[i, :k_i] > -np.inf  # fewer live rows than k
+                future.set_result((ids[i, :k_i][keep], scores[i, :k_i][keep]))
+
+
+class SearchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, search: ShardedSearch, embedder=None):
+        super().__init__(address, _Handler)
+        self.search = search
+        self.embedder = embedder  # EmbeddingBatcher for text queries, optional
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: SearchServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        search = self.server.search
+        if self.path.split("?", 1)[0] != "/stats":
+            return self._send(404, {"error": f"no route for {self.path}"})
+        stats = dict(search.stats)
+        stats.update(shards=len(search.shards), rows=search.n_rows)
+        if self.server.embedder is not None:
+            stats.update({f"embed_{name}": value for name, value in self.server.embedder.stats.items()})
+        self._send(200, stats)
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] != "/search":
+            return self._send(404, {"error": f"no route for {self.path}"})
+        search, embedder = self.server.search, self.server.embedder
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            if "text" in body or "texts" in body:
+                if embedder is None:
+                    raise ValueError("text queries need the server to run with --embed")
+                texts = body["texts"] if "texts" in body else [body["text"]]
+                vectors = None
+            else:
+                vectors = body["vectors"] if "vectors" in body else [body["vector"]]
+            k = int(body.get("k", 3))
+            columns = body.get("columns") or []
+            unknown = [c for c in columns if c not in search.columns]
+            if unknown:
+                raise KeyError(", ".join(unknown))
+            _check_k(k)
+            if vectors is not None:
+                vectors = [search.check_query(v, k) for v in vectors]
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send(400, {"error": f"bad request: {e}"})
+
+        if vectors is None:
+            try:
+                vectors = [f.result() for f in [embedder.submit(t) for t in texts]]
+            except Exception as e:
+                return self._send(502, {"error": f"embedding failed: {e}"})
+        try:
+            futures = [search.submit(v, k) for v in vectors]
+            hits = [future.result() for future in futures]
+        except Exception as e:
+            # e.g. an embedding model that does not match the store
+            return self._send(500, {"error": f"search failed: {e}"})
+        results = []
+        for ids, scores in hits:
+            results.append({
+                "rows": ids.tolist(),
+                "scores": scores.tolist(),
+                "columns": {c: search.columns[c][ids].tolist() for c in columns},
+            })
+        self._send(200, {"results": results})
+
+
+def bench(search: ShardedSearch, n_queries: int, threads: int = 32, k: int = 3):
+    """Measure queries/sec with ``threads`` concurrent clients going through the batcher."""
+    queries = np.random.default_rng(0).standard_normal((n_queries, search.dims)).astype(np.float32)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda q: search.submit(q, k).result(), queries))
+    elapsed = time.perf_counter() - start
+    batches = search.stats["batches"]
+    print(f"{n_queries} queries over {search.n_rows} rows on {len(search.shards)} shards: "
+          f"{n_queries / elapsed:.0f} queries/sec, {search.stats['queries'] / max(batches, 1):.1f} queries/batch")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve top-k search over an embedding store from several processes.")
+    parser.add_argument("store", help="Directory of the embedding store")
+    parser.add_argument("--shards", type=int, default=os.cpu_count(), help="Worker processes (default: one per core)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8020)
+    parser.add_argument("--max-batch", type=int, default=64, help="Most queries scattered together")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="How long to wait for a batch to fill")
+    parser.add_argument("--bench", type=int, metavar="N", help="Run N random queries and report throughput instead of serving")
+    parser.add_argument("--embed", action="store_true", help="Accept query texts, embedded with the configured OpenAI client")
+    parser.add_argument("--embed-model", help="Model for query texts (default: the store's model)")
+    parser.add_argument("--embed-wait-ms", type=float, default=10.0, help="How long to collect query texts per embeddings call")
+    args = parser.parse_args(argv)
+
+    store = VectorStore(args.store)
+    if not len(store):
+        sys.exit(f"Store {args.store} has no live rows to serve; ingest some reviews first (see ingest_reviews.py)")
+    embedder = None
+    if args.embed:
+        dotenv.load_dotenv()
+        # The embedding helpers live in lab-1.
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lab-1"))
+        from embedding_batcher import EmbeddingBatcher
+        from embeddings_utils import DEFAULT_MODEL
+
+        model = args.embed_model or store.model or DEFAULT_MODEL
+        embedder = EmbeddingBatcher(model=model, max_wait_ms=args.embed_wait_ms)
+
+    with ShardedSearch(store, args.shards, args.max_batch, args.max_wait_ms) as search:
+        if args.bench:
+            return bench(search, args.bench)
+        server = SearchServer((args.host, args.port), search, embedder)
+        print(f"Serving {search.n_rows} rows from {len(search.shards)} shards on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if embedder is not None:
+                embedder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Thread-safe, read-only semantic search over the review corpus.
+
+The notebook's ``search_reviews`` writes ``df["similarity"]`` into the shared
+dataframe and sorts a full copy on every query, so two concurrent queries in
+one process race on that column and each allocates a corpus-sized frame.
+
+``SearchService`` instead holds the corpus immutably: one normalized,
+read-only float32 matrix and the metadata columns as read-only arrays.
+Queries score the corpus one block of rows at a time into a scratch buffer
+owned by the calling thread, of at most ``MAX_SCRATCH_ELEMENTS`` floats
+whatever the corpus size. Each block's top-k (by ``argpartition``) is merged
+into the running top-k, and only those row IDs plus the requested columns
+are returned. Nothing shared is written after construction, so one
+instance can serve a thread pool of simultaneous users.
+
+Usage:
+    service = SearchService.from_store(VectorStore("data/reviews_store"))
+    hits = service.search(get_embedding("delicious beans"), k=3, columns=["combined"])
+    hits.rows, hits.scores, hits.columns["combined"]
+
+    python search_service.py data/reviews_store --threads 8 --queries 2000
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ann_index import normalize_rows, top_k
+from vector_store import VectorStore
+
+MAX_SCRATCH_ELEMENTS = 1 << 22  # per-thread score buffer: 16 MB of float32
+
+
+class SearchHits(NamedTuple):
+    rows: np.ndarray  # row positions in the corpus, best first
+    scores: np.ndarray  # cosine similarities
+    columns: Dict[str, np.ndarray]  # requested metadata columns for those rows
+
+
+class SearchService:
+    """Immutable corpus of normalized vectors + metadata columns."""
+
+    def __init__(self, vectors: np.ndarray, metadata: pd.DataFrame, max_batch: int = 64):
+        self.vectors = normalize_rows(vectors)
+        self.vectors.flags.writeable = False
+        self.columns: Dict[str, np.ndarray] = {}
+        for column in metadata.columns:
+            values = metadata[column].to_numpy(copy=True)
+            values.flags.writeable = False
+            self.columns[column] = values
+        self.max_batch = max_batch
+        self.block_rows = max(1, MAX_SCRATCH_ELEMENTS // max_batch)
+        self._local = threading.local()
+
+    @classmethod
+    def from_store(cls, store: VectorStore, **kwargs) -> "SearchService":
+        """Build from the live rows of a ``VectorStore``."""
+        metadata, vectors = store.load_live()
+        return cls(vectors, metadata, **kwargs)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, embedding_column: str = "embedding", **kwargs) -> "SearchService":
+        """Build from a dataframe holding one embedding per row, as in the notebooks."""
+        vectors = np.stack(df[embedding_column].to_numpy())
+        return cls(vectors, df.drop(columns=[embedding_column]), **kwargs)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _scratch(self, n_queries: int, n_rows: int) -> np.ndarray:
+        """This thread's score buffer as a contiguous ``(n_queries, n_rows)`` array, reused across queries."""
+        buffer = getattr(self._local, "scores", None)
+        if buffer is None:
+            buffer = np.empty(self.max_batch * self.block_rows, dtype=np.float32)
+            self._local.scores = buffer
+        return buffer[: n_queries * n_rows].reshape(n_queries, n_rows)
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray, columns: Optional[Sequence[str]]) -> SearchHits:
+        return SearchHits(rows, scores, {c: self.columns[c][rows] for c in columns or ()})
+
+    def search(self, query, k: int = 3, columns: Optional[Sequence[str]] = None) -> SearchHits:
+        """Top-``k`` rows by cosine similarity to ``query``."""
+        return self.search_many(np.asarray(query, dtype=np.float32)[None, :], k, columns)[0]
+
+    def search_many(self, queries, k: int = 3, columns: Optional[Sequence[str]] = None) -> List[SearchHits]:
+        """Top-``k`` rows for each query; scores ``max_batch`` queries per matrix product."""
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+        results = []
+        for start in range(0, len(queries), self.max_batch):
+            block = queries[start : start + self.max_batch]
+            best_rows = [np.empty(0, dtype=np.int64)] * len(block)
+            best_scores = [np.empty(0, dtype=np.float32)] * len(block)
+            for lo in range(0, len(self.vectors), self.block_rows):
+                rows = self.vectors[lo : lo + self.block_rows]
+                scores = self._scratch(len(block), len(rows))
+                np.matmul(block, rows.T, out=scores)
+                for i, row_scores in enumerate(scores):
+                    best = top_k(row_scores, k)
+                    # Fancy indexing copies the winners out of the buffer before the next block reuses it.
+                    candidates = np.concatenate([best_rows[i], best + lo])
+                    candidate_scores = np.concatenate([best_scores[i], row_scores[best]])
+                    keep = top_k(candidate_scores, k)
+                    best_rows[i], best_scores[i] = candidates[keep], candidate_scores[keep]
+            results.extend(self._hits(r, s, columns) for r, s in zip(best_rows, best_scores))
+        return results
+
+    def search_frame(self, query, k: int = 3, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Like :meth:`search`, as a small dataframe with a ``similarity`` column."""
+        hits = self.search(query, k, columns or list(self.columns))
+        frame = pd.DataFrame(hits.columns, index=hits.rows)
+        frame["similarity"] = hits.scores
+        return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure concurrent query throughput of a SearchService.")
+    parser.add_argument("store", help="Directory of the embedding store")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--queries", type=int, default=1000, help="Random queries to run")
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    service = SearchService.from_store(VectorStore(args.store))
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, service.vectors.shape[1])).astype(np.float32)
+    expected = [hits.rows for hits in service.search_many(queries, args.k)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda q: service.search(q, args.k), queries))
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(not np.array_equal(hits.rows, rows) for hits, rows in zip(results, expected))
+    print(f"{args.queries} queries over {len(service)} rows with {args.threads} threads: "
+          f"{args.queries / elapsed:.0f} queries/sec, {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    main()
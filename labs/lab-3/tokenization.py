@@ -0,0 +1,169 @@
+"""
+Batched, multi-threaded token counting for dataset preprocessing.
+
+Replaces the per-row ``df.combined.apply(lambda x: len(encoding.encode(x)))``
+pattern: texts are encoded with tiktoken's batch API (which runs on a thread
+pool and releases the GIL) one slice of the dataframe at a time, duplicates
+are encoded once, and results are cached by encoding and text hash so
+repeated runs over the same reviews cost nothing. The cache is a bounded LRU, so long-running
+processes over millions of reviews keep only the most recent counts.
+
+Usage:
+    from tokenization import add_token_counts
+    add_token_counts(df, "combined")          # adds df["n_tokens"]
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from chunking import DEFAULT_ENCODING, get_encoding
+
+DEFAULT_BATCH_SIZE = 10_000
+MAX_CACHED_COUNTS = 1_000_000  # about 150 MB of counts
+MAX_CACHED_IDS = 10_000  # token ID arrays are much larger than counts
+
+
+class TokenizedBatch(NamedTuple):
+    """Token counts for a batch of texts, plus token IDs in CSR layout if requested.
+
+    The IDs of text ``i`` are ``ids[offsets[i]:offsets[i + 1]]``.
+    """
+
+    counts: np.ndarray
+    ids: Optional[np.ndarray] = None
+    offsets: Optional[np.ndarray] = None
+
+
+def text_hash(text: str) -> bytes:
+    """Return a compact, stable key for a text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TokenCache:
+    """Thread-safe LRU cache of token counts (and optionally token IDs) keyed by encoding and text hash."""
+
+    def __init__(self, max_counts: int = MAX_CACHED_COUNTS, max_ids: int = MAX_CACHED_IDS):
+        self.max_counts = max_counts
+        self.max_ids = max_ids
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._ids: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _get(self, entries: OrderedDict, key: bytes):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def get_count(self, key: bytes) -> Optional[int]:
+        return self._get(self._counts, key)
+
+    def get_ids(self, key: bytes) -> Optional[np.ndarray]:
+        return self._get(self._ids, key)
+
+    def _put(self, entries: OrderedDict, key: bytes, value, limit: int):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def put(self, key: bytes, ids: List[int], keep_ids: bool = False):
+        with self._lock:
+            self._put(self._counts, key, len(ids), self.max_counts)
+            if keep_ids:
+                self._put(self._ids, key, np.asarray(ids, dtype=np.uint32), self.max_ids)
+
+    def save(self, path: str):
+        """Persist the token counts to an ``.npz`` file."""
+        with self._lock:
+            keys = np.frombuffer(b"".join(self._counts), dtype="S16")
+            counts = np.fromiter(self._counts.values(), dtype=np.int32, count=len(self._counts))
+        np.savez(path, keys=keys, counts=counts)
+
+    def load(self, path: str):
+        """Merge token counts previously written with :meth:`save`."""
+        with np.load(path) as data:
+            keys, counts = data["keys"], data["counts"]
+        with self._lock:
+            for key, count in zip((k.tobytes().ljust(16, b"\0") for k in keys), counts.tolist()):
+                self._put(self._counts, key, count, self.max_counts)
+
+
+_default_cache = TokenCache()
+
+
+def count_tokens(
+    texts: Sequence[str],
+    encoding_name: str = DEFAULT_ENCODING,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    num_threads: Optional[int] = None,
+    return_ids: bool = False,
+    cache: Optional[TokenCache] = _default_cache,
+) -> TokenizedBatch:
+    """Count tokens for many texts using tiktoken batch encoding.
+
+    Texts are encoded ``batch_size`` at a time. Unless ``return_ids`` is
+    set, each batch's token IDs are dropped as soon as they are counted, so
+    only one integer per distinct text is kept. Pass ``cache=None`` to
+    disable caching.
+    """
+    encoding = get_encoding(encoding_name)
+    num_threads = num_threads or os.cpu_count() or 1
+    # The default cache is shared by all encodings, so the encoding is part of the key.
+    keys = [text_hash(encoding_name + "\0" + text) for text in texts]
+
+    # Encode each distinct text that the cache cannot answer exactly once. Cached answers
+    # are copied here, since the LRU may evict them before this call returns.
+    count_of: Dict[bytes, int] = {}
+    ids_of: Dict[bytes, np.ndarray] = {}
+    pending: Dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key in pending or key in count_of:
+            continue
+        cached = None
+        if cache is not None:
+            cached = cache.get_ids(key) if return_ids else cache.get_count(key)
+        if cached is None:
+            pending[key] = text
+        elif return_ids:
+            ids_of[key], count_of[key] = cached, len(cached)
+        else:
+            count_of[key] = cached
+
+    pending_keys = list(pending)
+    for start in range(0, len(pending_keys), batch_size):
+        batch_keys = pending_keys[start : start + batch_size]
+        batch = encoding.encode_ordinary_batch([pending[k] for k in batch_keys], num_threads=num_threads)
+        for key, ids in zip(batch_keys, batch):
+            if cache is not None:
+                cache.put(key, ids, keep_ids=return_ids)
+            count_of[key] = len(ids)
+            if return_ids:
+                ids_of[key] = np.asarray(ids, dtype=np.uint32)
+        del batch
+
+    counts = np.fromiter((count_of[key] for key in keys), dtype=np.int32, count=len(keys))
+    if not return_ids:
+        return TokenizedBatch(counts)
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    flat = np.empty(int(offsets[-1]), dtype=np.uint32)
+    for i, key in enumerate(keys):
+        flat[offsets[i] : offsets[i + 1]] = ids_of[key]
+    return TokenizedBatch(counts, flat, offsets)
+
+
+def add_token_counts(df, column: str = "combined", out: str = "n_tokens", **kwargs):
+    """Add a column of token counts for ``df[column]`` and return the dataframe."""
+    df[out] = count_tokens(df[column].tolist(), **kwargs).counts
+    return df
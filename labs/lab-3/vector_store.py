@@ -0,0 +1,498 @@
+"""
+Segmented on-disk embedding store with incremental upserts and deletes.
+
+Layout of a store directory:
+
+    manifest.json     committed segments, their tombstones, ingestion checkpoint
+    seg-00000.npy     float32 vectors, one row per record (memory-mappable)
+    seg-00000.csv     metadata for the same rows (id, content_hash, text, ...)
+
+Segment files are immutable. Records are keyed by ``id``; a record may span
+several rows (e.g. the chunks of one long review). Updating a record writes
+its new rows to a new segment and tombstones the old rows, deleting a record
+only tombstones its rows. Tombstones are row numbers listed per segment in
+the manifest, and searches skip them via :attr:`Segment.live`.
+
+Every change becomes visible when the manifest is atomically replaced, so a
+crash never leaves a half-written segment in the store and the checkpoint
+always matches the stored rows. Several processes may open the same store
+(e.g. ``ingest_reviews.py`` and ``reembed.py``): every change happens under
+an exclusive lock on ``manifest.json.lock`` and starts by re-reading the
+manifest if another process replaced it, so segment names are never reused
+and no process commits a stale manifest. :meth:`VectorStore.compact` (or the
+background compactor) rewrites segments with many tombstones into a single
+new segment holding only their live rows.
+
+Every segment is tagged with the embedding model and dimensions of its
+vectors, and the manifest names the model the store serves. To switch
+models, :meth:`VectorStore.begin_version` opens a pending version next to
+the served one. A re-embedding job (``reembed.py``) fills it with
+:meth:`VectorStore.upsert_pending` while searches keep reading the served
+segments. :meth:`VectorStore.cut_over` then swaps the pending segments in
+with one manifest write, once every live record is re-embedded at its
+current content hash.
+"""
+
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+LOCK_FILE = MANIFEST + ".lock"
+LEGACY_MODEL = "text-embedding-3-small"  # model of stores written before segments were tagged
+
+
+class Segment(NamedTuple):
+    name: str
+    metadata: pd.DataFrame
+    vectors: np.ndarray  # memory-mapped, read-only
+    live: np.ndarray  # bool mask, False for tombstoned rows
+
+
+def _atomic_write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class _StoreLock:
+    """Thread lock plus an exclusive lock on a file shared with other processes.
+
+    Reentrant within a thread; the file is locked, and ``on_acquire`` called,
+    only by the outermost acquisition.
+    """
+
+    def __init__(self, path: str, on_acquire):
+        self.path = path
+        self.on_acquire = on_acquire
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                self._file = open(self.path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                self.on_acquire()
+            except BaseException:
+                self._release_file()
+                self._depth -= 1
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            self._release_file()
+        self._lock.release()
+
+    def _release_file(self):
+        if self._file is None:
+            return
+        if fcntl is None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # also releases the flock
+        self._file = None
+
+
+class VectorStore:
+    """A directory of immutable (vectors, metadata) segments plus tombstones."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"dims": None, "model": None, "next_segment": 0, "segments": [], "checkpoint": {}, "pending": None}
+        self._manifest_stat = None
+        self._index: Dict[str, tuple] = {}
+        self._pending_index: Dict[str, tuple] = {}
+        self._lock = _StoreLock(os.path.join(path, LOCK_FILE), self._refresh)
+        self._compactor = None
+        self._stop = threading.Event()
+        with self._lock:  # reads the manifest
+            pass
+
+    def _stat(self, manifest_path: str):
+        try:
+            st = os.stat(manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """Reload the manifest and the index if another process committed since we last looked."""
+        manifest_path = os.path.join(self.path, MANIFEST)
+        stat = self._stat(manifest_path)
+        if stat is None or stat == self._manifest_stat:
+            return
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest.setdefault("model", LEGACY_MODEL if manifest["segments"] else None)
+        manifest.setdefault("pending", None)
+        for seg in manifest["segments"]:
+            seg.setdefault("deleted", [])
+            seg.setdefault("model", manifest["model"])
+            seg.setdefault("dims", manifest["dims"])
+        self.manifest = manifest
+        self._manifest_stat = stat
+        self._load_index()
+
+    def _load_index(self):
+        """Build ``id -> (segment name, rows, content hash)`` for the live rows of each version."""
+        self._index = self._build_index(self.segments)
+        self._pending_index = self._build_index(self.pending["segments"] if self.pending else [])
+
+    def _build_index(self, segments: List[dict]) -> Dict[str, tuple]:
+        index = {}
+        for seg in segments:
+            keys = pd.read_csv(self._file(seg["name"], ".csv"), usecols=["id", "content_hash"], dtype=str)
+            live = np.ones(seg["rows"], dtype=bool)
+            live[seg["deleted"]] = False
+            for key, group in keys[live].groupby("id", sort=False):
+                index[key] = (seg["name"], group.index.to_numpy(), group.content_hash.iloc[0])
+        return index
+
+    @property
+    def dims(self) -> Optional[int]:
+        return self.manifest["dims"]
+
+    @property
+    def model(self) -> Optional[str]:
+        """Embedding model of the served vectors (None for an empty, untagged store)."""
+        return self.manifest["model"]
+
+    @property
+    def pending(self) -> Optional[dict]:
+        """The version being re-embedded: ``{"model", "dims", "segments"}``, or None."""
+        return self.manifest["pending"]
+
+    @property
+    def checkpoint(self) -> dict:
+        """Opaque progress marker committed together with the last change."""
+        return self.manifest["checkpoint"]
+
+    @property
+    def segments(self) -> List[dict]:
+        return self.manifest["segments"]
+
+    def __len__(self):
+        """Number of live rows."""
+        with self._lock:
+            return sum(seg["rows"] - len(seg["deleted"]) for seg in self.segments)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return str(key) in self._index
+
+    def _file(self, name: str, suffix: str) -> str:
+        return os.path.join(self.path, name + suffix)
+
+    def _segment(self, name: str, segments: Optional[List[dict]] = None) -> dict:
+        return next(seg for seg in (self.segments if segments is None else segments) if seg["name"] == name)
+
+    def _commit(self, checkpoint: Optional[dict]):
+        if checkpoint is not None:
+            self.manifest["checkpoint"] = checkpoint
+        manifest_path = os.path.join(self.path, MANIFEST)
+        _atomic_write_json(manifest_path, self.manifest)
+        self._manifest_stat = self._stat(manifest_path)
+
+    def _write_segment(self, metadata: pd.DataFrame, vectors: np.ndarray, version: dict) -> dict:
+        """Write one segment of ``version`` (the manifest or the pending version)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if version["dims"] is None:
+            version["dims"] = int(vectors.shape[1])
+        elif vectors.shape[1] != version["dims"]:
+            raise ValueError(f"expected {version['dims']}-dimensional vectors, got {vectors.shape[1]}")
+        name = f"seg-{self.manifest['next_segment']:05d}"
+        self.manifest["next_segment"] += 1
+        np.save(self._file(name, ".npy"), vectors)
+        metadata.to_csv(self._file(name, ".csv"), index=False)
+        return {"name": name, "rows": len(vectors), "deleted": [], "model": version["model"], "dims": version["dims"]}
+
+    def _tombstone(self, key: str, pending: bool = False):
+        index, segments = (self._pending_index, self.pending["segments"]) if pending else (self._index, self.segments)
+        entry = index.pop(key, None)
+        if entry is not None:
+            seg = self._segment(entry[0], segments)
+            seg["deleted"] = sorted(set(seg["deleted"]).union(entry[1].tolist()))
+
+    def _add(self, metadata: pd.DataFrame, vectors: np.ndarray, pending: bool = False):
+        version = self.pending if pending else self.manifest
+        index = self._pending_index if pending else self._index
+        metadata = metadata.reset_index(drop=True)
+        seg = self._write_segment(metadata, vectors, version)
+        keys = metadata["id"].astype(str)
+        for key, group in metadata.groupby(keys, sort=False):
+            self._tombstone(key, pending)
+            index[key] = (seg["name"], group.index.to_numpy(), str(group.content_hash.iloc[0]))
+        version["segments"].append(seg)
+
+    def changed(self, ids: Iterable, content_hashes: Iterable[str]) -> np.ndarray:
+        """Return a mask of records that are new or whose content hash differs."""
+        with self._lock:
+            return np.array(
+                [self._index.get(str(key), (None, None, None))[2] != h for key, h in zip(ids, content_hashes)],
+                dtype=bool,
+            )
+
+    def upsert(
+        self,
+        metadata: pd.DataFrame,
+        vectors: np.ndarray,
+        checkpoint: Optional[dict] = None,
+        model: Optional[str] = None,
+        delete: Iterable = (),
+    ) -> int:
+        """Add or replace records; ``metadata`` needs ``id`` and ``content_hash`` columns.
+
+        All rows of a record must be in the same call. An empty batch only
+        advances the checkpoint. ``model`` names the model that produced the
+        vectors; it must be the served model (an empty store adopts it).
+        The records listed in ``delete`` are tombstoned in the same commit;
+        returns how many of them existed.
+        """
+        if len(metadata) != len(vectors):
+            raise ValueError("metadata and vectors must have the same number of rows")
+        with self._lock:
+            if model is not None and model != self.model:
+                if self.model is not None and self.segments:
+                    raise ValueError(f"store {self.path} holds {self.model} vectors, not {model}")
+                self.manifest["model"] = model
+            if len(vectors):
+                self._add(metadata, vectors)
+            found = self._delete(delete)
+            self._commit(checkpoint)
+            return found
+
+    def _delete(self, ids: Iterable) -> int:
+        found = 0
+        for key in ids:
+            key = str(key)
+            if key in self._index:
+                self._tombstone(key)
+                found += 1
+        return found
+
+    def delete(self, ids: Iterable, checkpoint: Optional[dict] = None) -> int:
+        """Tombstone every row of the given records; returns how many records existed."""
+        with self._lock:
+            found = self._delete(ids)
+            self._commit(checkpoint)
+            return found
+
+    def begin_version(self, model: str, dims: Optional[int] = None):
+        """Start (or resume) re-embedding the store with ``model`` into a pending version."""
+        with self._lock:
+            if self.pending is not None:
+                if self.pending["model"] == model and dims in (None, self.pending["dims"]):
+                    return
+                raise ValueError(f"store {self.path} is already migrating to {self.pending['model']}")
+            if model == self.model and dims in (None, self.dims):
+                raise ValueError(f"store {self.path} already holds {model} vectors")
+            self.manifest["pending"] = {"model": model, "dims": dims, "segments": []}
+            self._pending_index = {}
+            self._commit(None)
+
+    def pending_backlog(self) -> Dict[str, str]:
+        """``id -> content hash`` of served records not yet re-embedded at that content hash."""
+        with self._lock:
+            if self.pending is None:
+                return {}
+            return {
+                key: content_hash
+                for key, (_, _, content_hash) in self._index.items()
+                if self._pending_index.get(key, (None, None, None))[2] != content_hash
+            }
+
+    def upsert_pending(self, metadata: pd.DataFrame, vectors: np.ndarray):
+        """Add or replace records in the pending version; same rules as :meth:`upsert`."""
+        if len(metadata) != len(vectors):
+            raise ValueError("metadata and vectors must have the same number of rows")
+        with self._lock:
+            if self.pending is None:
+                raise ValueError(f"store {self.path} has no pending version")
+            if len(vectors):
+                self._add(metadata, vectors, pending=True)
+                self._commit(None)
+
+    def cut_over(self) -> bool:
+        """Serve the pending version if it covers every live record; returns whether it did.
+
+        Records deleted since they were re-embedded are dropped from the new
+        version. The switch is a single manifest write; the old segments'
+        files are removed afterwards (open memory maps keep working).
+        """
+        with self._lock:
+            if self.pending is None:
+                raise ValueError(f"store {self.path} has no pending version")
+            if self.pending_backlog():
+                return False
+            for key in set(self._pending_index) - set(self._index):
+                self._tombstone(key, pending=True)
+            old = [seg["name"] for seg in self.segments]
+            pending = self.manifest["pending"]
+            self.manifest.update(model=pending["model"], dims=pending["dims"], segments=pending["segments"], pending=None)
+            self._index, self._pending_index = self._pending_index, {}
+            self._commit(None)
+        self._remove_segments(old)
+        return True
+
+    def abort_version(self):
+        """Drop the pending version and its segments."""
+        with self._lock:
+            if self.pending is None:
+                return
+            names = [seg["name"] for seg in self.pending["segments"]]
+            self.manifest["pending"] = None
+            self._pending_index = {}
+            self._commit(None)
+        self._remove_segments(names)
+
+    def _remove_segments(self, names: Iterable[str]):
+        for name in names:
+            for suffix in (".npy", ".csv"):
+                try:
+                    os.remove(self._file(name, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def iter_segments(self) -> Iterator[Segment]:
+        """Yield every committed segment; vectors are memory-mapped."""
+        with self._lock:
+            segments = [(seg["name"], seg["rows"], list(seg["deleted"])) for seg in self.segments]
+        for name, rows, deleted in segments:
+            live = np.ones(rows, dtype=bool)
+            live[deleted] = False
+            yield Segment(
+                name,
+                pd.read_csv(self._file(name, ".csv")),
+                np.load(self._file(name, ".npy"), mmap_mode="r"),
+                live,
+            )
+
+    def load_live(self):
+        """Return ``(metadata, vectors)`` for all live rows, vectors as one in-memory array."""
+        frames, parts = [], []
+        for seg in self.iter_segments():
+            frames.append(seg.metadata[seg.live])
+            parts.append(np.asarray(seg.vectors[seg.live]))
+        if not frames:
+            return pd.DataFrame(), np.empty((0, self.dims or 0), dtype=np.float32)
+        return pd.concat(frames, ignore_index=True), np.concatenate(parts)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Load all live rows as one dataframe with an ``embedding`` column.
+
+        Matches the layout the search notebook expects; only use on stores
+        that fit in memory.
+        """
+        frames = []
+        for seg in self.iter_segments():
+            metadata = seg.metadata[seg.live].copy()
+            metadata["embedding"] = list(np.asarray(seg.vectors[seg.live]))
+            frames.append(metadata)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def compact(self, min_dead_fraction: float = 0.25) -> int:
+        """Rewrite segments whose tombstoned fraction is at least ``min_dead_fraction``.
+
+        Their live rows are merged into one new segment. Upserts and deletes
+        may run concurrently; changes made while the new segment was being
+        written are carried over before it is committed. Returns the number of
+        segments removed.
+        """
+        with self._lock:
+            victims = [
+                (seg["name"], seg["rows"], list(seg["deleted"]))
+                for seg in self.segments
+                if seg["deleted"] and len(seg["deleted"]) >= min_dead_fraction * seg["rows"]
+            ]
+            if not victims:
+                return 0
+            # Reserve the new segment's name for other processes too.
+            name = f"seg-{self.manifest['next_segment']:05d}"
+            self.manifest["next_segment"] += 1
+            self._commit(None)
+            dims = self.dims
+
+        # Copy live rows outside the lock; remember where each row came from.
+        frames, parts, origin = [], [], []
+        for victim, rows, deleted in victims:
+            live = np.ones(rows, dtype=bool)
+            live[deleted] = False
+            rows = np.flatnonzero(live)
+            frames.append(pd.read_csv(self._file(victim, ".csv")).iloc[rows])
+            parts.append(np.load(self._file(victim, ".npy"), mmap_mode="r")[rows])
+            origin += [(victim, int(row)) for row in rows]
+        metadata = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        vectors = np.concatenate(parts) if parts else np.empty((0, dims), dtype=np.float32)
+        if len(vectors):
+            np.save(self._file(name, ".npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+            metadata.to_csv(self._file(name, ".csv"), index=False)
+
+        with self._lock:
+            if not {victim for victim, _, _ in victims} <= {seg["name"] for seg in self.segments}:
+                # Another writer compacted them or cut over to a new version meanwhile.
+                self._remove_segments([name])
+                return 0
+            # Rows tombstoned while we were copying stay tombstoned.
+            now_deleted = {victim: set(self._segment(victim)["deleted"]) for victim, _, _ in victims}
+            new_row = {src: i for i, src in enumerate(origin)}
+            deleted = sorted(i for i, (victim, row) in enumerate(origin) if row in now_deleted[victim])
+            for key, (seg_name, rows, content_hash) in list(self._index.items()):
+                if seg_name in now_deleted:
+                    moved = np.array([new_row[(seg_name, int(r))] for r in rows])
+                    self._index[key] = (name, moved, content_hash)
+
+            names = set(now_deleted)
+            kept = [seg for seg in self.segments if seg["name"] not in names]
+            if len(vectors):
+                kept.append({"name": name, "rows": len(vectors), "deleted": deleted, "model": self.model, "dims": self.dims})
+            self.manifest["segments"] = kept
+            self._commit(None)
+
+        self._remove_segments(names)
+        return len(names)
+
+    def start_compactor(self, interval: float = 60.0, min_dead_fraction: float = 0.25):
+        """Run :meth:`compact` every ``interval`` seconds on a daemon thread."""
+        if self._compactor is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.compact(min_dead_fraction)
+
+        self._stop.clear()
+        self._compactor = threading.Thread(target=loop, name="vector-store-compactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self):
+        if self._compactor is not None:
+            self._stop.set()
+            self._compactor.join()
+            self._compactor = None